@@ -0,0 +1,226 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import mimetypes
+import tempfile
+import threading
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where fetched stylesheets, fonts and images are kept between runs
+ASSET_CACHE_DIR = os.environ.get(
+    "ASSET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "weasyprint_assets")
+)
+# "online" fetches assets missing from the cache; "offline" never uses the network
+ASSET_FETCH_MODE = os.environ.get("ASSET_FETCH_MODE", "online")
+# What to do with an asset that cannot be had: "fail" skips it straight away,
+# "placeholder" substitutes an empty stylesheet or a blank image
+ASSET_OFFLINE_POLICY = os.environ.get("ASSET_OFFLINE_POLICY", "fail")
+# Seconds to wait for a remote asset before giving up on it
+ASSET_FETCH_TIMEOUT = 5
+# Hosts that documents from outside (those rendered with a file_root, such as
+# uploads to /render) may load remote assets from, comma-separated. None by
+# default, so an upload cannot make the server request internal addresses;
+# only list hosts you trust, as their redirects are followed.
+TRUSTED_ASSET_HOSTS = [
+    host.strip().lower()
+    for host in os.environ.get("TRUSTED_ASSET_HOSTS", "").split(",")
+    if host.strip()
+]
+
+# 1x1 transparent PNG
+BLANK_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+PLACEHOLDERS = {
+    "text/css": b"",
+    "image/svg+xml": b'<svg xmlns="http://www.w3.org/2000/svg"/>',
+}
+
+
+class AssetUnavailable(Exception):
+    """Raised to WeasyPrint for an asset that is not cached and may not be fetched or read."""
+
+
+class CachingURLFetcher(URLFetcher):
+    """A WeasyPrint url_fetcher that keeps remote assets in a local content-addressed cache.
+
+    Asset bodies are stored once under the SHA-256 of their content, and each
+    URL points at its body, so a logo served from many URLs is kept once.
+    Local files and data: URIs go straight to WeasyPrint's own fetcher. Within
+    a run every URL is looked up at most once, including ones that failed.
+
+    With file_root set, for documents that come from outside such as uploads,
+    local files outside that directory are refused, and so are remote URLs
+    unless their host is in allowed_hosts. Only file:, data: and http(s):
+    URLs are fetched at all then.
+    """
+
+    def __init__(
+        self,
+        cache_dir=ASSET_CACHE_DIR,
+        mode=ASSET_FETCH_MODE,
+        policy=ASSET_OFFLINE_POLICY,
+        timeout=ASSET_FETCH_TIMEOUT,
+        file_root=None,
+        allowed_hosts=TRUSTED_ASSET_HOSTS,
+    ):
+        if mode not in ("online", "offline"):
+            raise ValueError(f"Unknown asset fetch mode '{mode}'.")
+        if policy not in ("fail", "placeholder"):
+            raise ValueError(f"Unknown offline asset policy '{policy}'.")
+        super().__init__(timeout=timeout)
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.policy = policy
+        self.timeout = timeout
+        self.file_root = os.path.realpath(file_root) if file_root else None
+        self.allowed_hosts = {host.lower() for host in allowed_hosts}
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+        # url -> result dict, or None for URLs that could not be had
+        self.seen = {}
+        self.lock = threading.Lock()
+        self.stats = {"memory": 0, "disk": 0, "network": 0, "unavailable": 0}
+
+    def fetch(self, url, headers=None):
+        parsed = urlparse(url)
+        if self.file_root is not None:
+            self._check_confined(url, parsed)
+        if parsed.scheme not in ("http", "https"):
+            return super().fetch(url, headers)
+
+        with self.lock:
+            if url in self.seen:
+                self.stats["memory"] += 1
+                return self._response(url, self.seen[url])
+
+        result = self._from_disk(url)
+        if result is not None:
+            source = "disk"
+        elif self.mode == "online":
+            result = self._from_network(url, headers)
+            source = "network" if result is not None else "unavailable"
+        else:
+            source = "unavailable"
+
+        with self.lock:
+            self.seen[url] = result
+            self.stats[source] += 1
+        return self._response(url, result)
+
+    def _check_confined(self, url, parsed):
+        """Raises AssetUnavailable for a URL a document from outside may not load."""
+        if parsed.scheme == "file":
+            path = os.path.realpath(url2pathname(parsed.path))
+            if os.path.commonpath([path, self.file_root]) != self.file_root:
+                raise AssetUnavailable(f"{url} is outside {self.file_root}")
+        elif parsed.scheme in ("http", "https"):
+            if (parsed.hostname or "").lower() not in self.allowed_hosts:
+                raise AssetUnavailable(f"{url} is not on a trusted asset host")
+        elif parsed.scheme != "data":
+            raise AssetUnavailable(f"{url} uses a scheme that is not allowed")
+
+    @staticmethod
+    def _content_type(mime_type, encoding=None):
+        if not mime_type:
+            return {}
+        if encoding:
+            return {"Content-Type": f"{mime_type}; charset={encoding}"}
+        return {"Content-Type": mime_type}
+
+    def _response(self, url, result):
+        if result is None:
+            return self._unavailable(url)
+        with open(self._object_path(result["content"]), "rb") as f:
+            body = f.read()
+        return URLFetcherResponse(
+            result.get("redirected_url") or url,
+            body,
+            self._content_type(result.get("mime_type"), result.get("encoding")),
+        )
+
+    def _unavailable(self, url):
+        if self.policy == "placeholder":
+            mime_type = mimetypes.guess_type(urlparse(url).path)[0] or ""
+            if mime_type in PLACEHOLDERS:
+                return URLFetcherResponse(
+                    url, PLACEHOLDERS[mime_type], self._content_type(mime_type)
+                )
+            if mime_type.startswith("image/"):
+                return URLFetcherResponse(
+                    url, BLANK_PNG, self._content_type("image/png")
+                )
+        # Fonts and anything unknown are skipped; WeasyPrint falls back
+        raise AssetUnavailable(f"{url} is not cached and could not be fetched")
+
+    def _url_path(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "urls", f"{name}.json")
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.cache_dir, "objects", content_hash)
+
+    def _from_disk(self, url):
+        try:
+            with open(self._url_path(url), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if os.path.exists(self._object_path(result["content"])) else None
+
+    def _from_network(self, url, headers=None):
+        # A fresh opener per download: URLFetcher keeps per-request state for
+        # redirects, and this fetcher is shared between threads
+        try:
+            response = URLFetcher(timeout=self.timeout).fetch(url, headers)
+            try:
+                body = response.read()
+            finally:
+                response.close()
+        except Exception as e:
+            logger.warning(f"Could not fetch {url}: {str(e)}")
+            return None
+
+        has_type = "Content-Type" in response.headers
+        content_hash = hashlib.sha256(body).hexdigest()
+        result = {
+            "url": url,
+            "content": content_hash,
+            "mime_type": response.content_type if has_type else None,
+            "encoding": response.charset,
+            "redirected_url": response.url,
+        }
+        self._write_atomic(self._object_path(content_hash), body)
+        self._write_atomic(self._url_path(url), json.dumps(result).encode("utf-8"))
+        logger.info(f"Cached {url} ({len(body)} bytes)")
+        return result
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# file_root -> fetcher; they all share the cache on disk
+_default_fetchers = {}
+_default_lock = threading.Lock()
+
+
+def get_url_fetcher(file_root=None):
+    """The process-wide caching fetcher for file_root, created on first use."""
+    with _default_lock:
+        fetcher = _default_fetchers.get(file_root)
+        if fetcher is None:
+            fetcher = _default_fetchers[file_root] = CachingURLFetcher(
+                file_root=file_root
+            )
+        return fetcher
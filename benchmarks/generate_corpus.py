@@ -0,0 +1,271 @@
+"""Generates a synthetic submissions export for benchmarking.
+
+Run from the repository root:
+
+    python -m benchmarks.generate_corpus --learners 800 --files-per-learner 25
+
+The corpus folder holds one flat export (every filename shape that
+pattern_recognition and snapshot_converter handle, HTML submissions of
+varying size, submission JSONs and some files that match no pattern) plus
+an apprentice_info fixture as CSV and as SQL for loading into Postgres.
+"""
+
+import os
+import csv
+import json
+import uuid
+import base64
+import random
+import argparse
+from datetime import datetime, timedelta
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "corpus")
+
+FIRST_NAMES = [
+    "Amelia",
+    "Oliver",
+    "Isla",
+    "George",
+    "Ava",
+    "Noah",
+    "Mia",
+    "Arthur",
+    "Freya",
+    "Leo",
+    "Priya",
+    "Mohammed",
+    "Chloe",
+    "Kwame",
+    "Siobhan",
+    "Jakub",
+]
+LAST_NAMES = [
+    "Smith",
+    "Jones",
+    "Taylor",
+    "Brown",
+    "Williams",
+    "Patel",
+    "Khan",
+    "Evans",
+    "O'Neill",
+    "Nowak",
+    "Okafor",
+    "Wilson",
+    "Thomas",
+    "Roberts",
+    "Walker",
+]
+MIDDLE_NAMES = ["Rose", "James", "Mae", "Ali", "Grace"]
+DESCRIPTIONS = [
+    "Reflective account",
+    "Portfolio evidence [Unit 3]",
+    "Project plan (final)",
+    "Risk assessment - site visit",
+    "Meeting notes, week 4",
+    "Customer journey & feedback",
+    "Witness statement!",
+    "Off-the-job log",
+    "Observation record",
+]
+ATTACHMENT_EXTENSIONS = ["pdf", "docx", "xlsx", "png", "jpg", "pptx", "txt"]
+MULTI_DOT_EXTENSIONS = [".tar.gz", ".backup.docx", ".v2.pdf"]
+
+# 1x1 PNG, repeated to stand in for embedded photos
+PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+def learner_name(rng):
+    name = [rng.choice(FIRST_NAMES)]
+    # Roughly one learner in five has a three-part name
+    if rng.random() < 0.2:
+        name.append(rng.choice(MIDDLE_NAMES))
+    name.append(rng.choice(LAST_NAMES))
+    return " ".join(name)
+
+
+def timestamp(rng, digits=6):
+    moment = datetime(2023, 1, 1) + timedelta(seconds=rng.randrange(60 * 60 * 24 * 600))
+    time_part = moment.strftime("%H%M%S")[:digits]
+    return f"{moment:%Y%m%d}T{time_part}-{rng.randrange(1000):03d}Z"
+
+
+def export_filename(rng, learner_uuid, shape, extension):
+    """Builds one export filename in the given shape."""
+    submission_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+    description = rng.choice(DESCRIPTIONS)
+    identifier = f"{rng.choice(['activity', 'evidence', 'review'])}{rng.randrange(100)}"
+
+    if shape == "two_uuid":
+        return f"{learner_uuid}.{submission_uuid}.{timestamp(rng)}.{description}.{extension}"
+    if shape == "two_uuid_short_time":
+        return f"{learner_uuid}.{submission_uuid}.{timestamp(rng, 5)}.{description}.{extension}"
+    if shape == "two_uuid_multi_dot":
+        return f"{learner_uuid}.{submission_uuid}.{timestamp(rng)}.{description}{rng.choice(MULTI_DOT_EXTENSIONS)}"
+    if shape == "identifier":
+        return f"{learner_uuid}.{identifier}.{timestamp(rng)}.{extension}"
+    if shape == "identifier_description":
+        return f"{learner_uuid}.{identifier}.{timestamp(rng)}.{description}.{extension}"
+    raise ValueError(f"Unknown filename shape '{shape}'.")
+
+
+SHAPES = [
+    "two_uuid",
+    "two_uuid_short_time",
+    "two_uuid_multi_dot",
+    "identifier",
+    "identifier_description",
+]
+
+
+def html_document(rng, size_class):
+    """An HTML submission; size_class picks roughly how heavy it is."""
+    paragraphs, images, table_rows = {
+        "small": (3, 0, 0),
+        "medium": (30, 2, 20),
+        "large": (200, 20, 100),
+    }[size_class]
+
+    image = base64.b64encode(PIXEL_PNG * rng.randint(1, 50)).decode("ascii")
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        "<title>Submission</title>",
+        "<style>body{font-family:sans-serif} td{border:1px solid #999}</style>",
+        "</head><body><h1>Submission</h1>",
+    ]
+    for i in range(paragraphs):
+        parts.append(f"<h2>Section {i + 1}</h2>" if i % 10 == 0 else "")
+        parts.append(
+            "<p>" + "Lorem ipsum dolor sit amet. " * rng.randint(5, 40) + "</p>"
+        )
+    for _ in range(images):
+        parts.append(f"<img src='data:image/png;base64,{image}' width='400'>")
+    if table_rows:
+        parts.append("<table>")
+        for row in range(table_rows):
+            parts.append(f"<tr><td>{row}</td><td>Criterion met</td><td>Yes</td></tr>")
+        parts.append("</table>")
+    parts.append("<script>console.log('tracking');</script></body></html>")
+    return "".join(parts)
+
+
+def submission_json(rng, name):
+    first, *_, last = name.split()
+    files = [
+        {"fileName": f"{rng.choice(DESCRIPTIONS)}.{rng.choice(ATTACHMENT_EXTENSIONS)}"}
+        for _ in range(rng.randint(0, 3))
+    ]
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "comment": rng.choice(DESCRIPTIONS) + " - " + "feedback " * rng.randint(1, 10),
+        "submissionDate": f"{timestamp(rng)[:8]}T12:00:00Z",
+        "submitterFirstName": first,
+        "submitterLastName": last,
+        "files": files,
+    }
+
+
+def write_fixture(folder, learners):
+    with open(os.path.join(folder, "apprentice_info.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ApplicationId", "learner_full_name"])
+        for learner_uuid, name in learners:
+            writer.writerow([learner_uuid.upper(), name])
+
+    with open(os.path.join(folder, "apprentice_info.sql"), "w") as f:
+        f.write(
+            "CREATE TABLE IF NOT EXISTS apprentice_info "
+            "(ApplicationId text PRIMARY KEY, learner_full_name text);\n"
+        )
+        for learner_uuid, name in learners:
+            escaped = name.replace("'", "''")
+            f.write(
+                "INSERT INTO apprentice_info VALUES "
+                f"('{learner_uuid.upper()}', '{escaped}') ON CONFLICT DO NOTHING;\n"
+            )
+
+
+def generate(output, learners=100, files_per_learner=20, unknown_ratio=0.02, seed=1):
+    """Writes the corpus and returns a summary of what was generated."""
+    rng = random.Random(seed)
+    export_folder = os.path.join(output, "export")
+    os.makedirs(export_folder, exist_ok=True)
+
+    learner_rows = []
+    counts = {"html": 0, "json": 0, "attachment": 0, "unmatched": 0, "bytes": 0}
+    for _ in range(learners):
+        learner_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+        name = learner_name(rng)
+        # A few learners are missing from the fixture, as in real exports
+        if rng.random() >= unknown_ratio:
+            learner_rows.append((learner_uuid, name))
+
+        for _ in range(files_per_learner):
+            kind = rng.choices(["html", "json", "attachment"], weights=[4, 1, 5])[0]
+            shape = rng.choice(SHAPES)
+            if kind == "html":
+                filename = export_filename(rng, learner_uuid, shape, "html")
+                size_class = rng.choices(["small", "medium", "large"], [70, 25, 5])[0]
+                content = html_document(rng, size_class).encode("utf-8")
+            elif kind == "json":
+                filename = f"{uuid.UUID(int=rng.getrandbits(128))}.json"
+                content = json.dumps(submission_json(rng, name)).encode("utf-8")
+            else:
+                extension = rng.choice(ATTACHMENT_EXTENSIONS)
+                filename = export_filename(rng, learner_uuid, shape, extension)
+                content = rng.randbytes(rng.randint(1_000, 200_000))
+
+            path = os.path.join(export_folder, filename)
+            if os.path.exists(path):
+                continue
+            with open(path, "wb") as f:
+                f.write(content)
+            counts[kind] += 1
+            counts["bytes"] += len(content)
+
+    # Files that match no pattern and must be left alone
+    for i in range(max(1, learners * files_per_learner // 100)):
+        with open(os.path.join(export_folder, f"readme {i}.txt"), "w") as f:
+            f.write("not part of the export")
+        counts["unmatched"] += 1
+
+    write_fixture(output, learner_rows)
+
+    summary = {
+        "learners": learners,
+        "files_per_learner": files_per_learner,
+        "seed": seed,
+        "files": counts["html"]
+        + counts["json"]
+        + counts["attachment"]
+        + counts["unmatched"],
+        **counts,
+    }
+    with open(os.path.join(output, "corpus.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--learners", type=int, default=100)
+    parser.add_argument("--files-per-learner", type=int, default=20)
+    parser.add_argument("--unknown-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    summary = generate(
+        args.output,
+        learners=args.learners,
+        files_per_learner=args.files_per_learner,
+        unknown_ratio=args.unknown_ratio,
+        seed=args.seed,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
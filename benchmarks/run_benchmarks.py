@@ -0,0 +1,282 @@
+"""Measures files/sec and peak RSS for each entry point against a generated corpus.
+
+Run from the repository root after generating a corpus:
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --only parse_filenames json_to_csv
+    python -m benchmarks.run_benchmarks --compare
+
+Every benchmark runs in its own process on a fresh copy of the export, so
+peak RSS is per entry point and renames from one run never leak into the
+next. Results are saved under benchmarks/results/ keyed by git commit.
+
+Learner names come from the corpus's apprentice_info.csv through the CSV
+learner directory, so no database is needed. Pass --learner-directory
+postgres to benchmark against the configured database instead, after
+loading benchmarks/corpus/apprentice_info.sql into it.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_CORPUS = os.path.join(BENCHMARK_DIR, "corpus")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+def _files_in(folder):
+    return [entry.path for entry in os.scandir(folder) if entry.is_file()]
+
+
+def bench_parse_filenames(folder):
+    from pattern_recognition import Pattern_Recog
+
+    pattern_recog = Pattern_Recog()
+    names = [os.path.basename(path) for path in _files_in(folder)]
+    for name in names:
+        pattern_recog.parse_filename(name)
+    return len(names)
+
+
+def bench_filename_table(folder):
+    from filename_table import parse_directory
+
+    return len(parse_directory(folder))
+
+
+def bench_remove_unique_identifier(folder):
+    from pattern_recognition import Pattern_Recog
+
+    pattern_recog = Pattern_Recog()
+    names = [os.path.basename(path) for path in _files_in(folder)]
+    for name in names:
+        pattern_recog.remove_unique_identifier(name)
+    return len(names)
+
+
+def bench_json_to_csv(folder):
+    from json_to_csv_converter import JSONtoCSVConverter
+
+    count = sum(1 for path in _files_in(folder) if path.endswith(".json"))
+    JSONtoCSVConverter().process_folder(folder)
+    return count
+
+
+def bench_organise_by_learner(folder):
+    from folder_organiser import folder_organiser
+
+    count = len(_files_in(folder))
+    folder_organiser().organise_files(folder, group_by="uuid")
+    return count
+
+
+def bench_db_converter(folder):
+    import db_converter_3
+
+    count = len(_files_in(folder))
+    db_converter_3.process_files_in_folder(folder)
+    db_converter_3.router.shutdown()
+    return count
+
+
+def bench_snapshot_converter(folder):
+    import snapshot_converter
+
+    count = len(_files_in(folder))
+    snapshot_converter.init_connection_pool()
+    try:
+        snapshot_converter.process_files_in_folder(folder)
+    finally:
+        snapshot_converter.close_connection_pool()
+    return count
+
+
+# name -> (function, looks up learner names)
+BENCHMARKS = {
+    "parse_filenames": (bench_parse_filenames, False),
+    "filename_table": (bench_filename_table, False),
+    "json_to_csv": (bench_json_to_csv, False),
+    "remove_unique_identifier": (bench_remove_unique_identifier, True),
+    "organise_by_learner": (bench_organise_by_learner, True),
+    "db_converter": (bench_db_converter, True),
+    "snapshot_converter": (bench_snapshot_converter, True),
+}
+
+
+def run_child(name, folder):
+    """Runs one benchmark in this process and prints its result as JSON."""
+    import logging
+
+    # Per-file logging would dominate the timings
+    logging.disable(logging.WARNING)
+    sys.stdout = open(os.devnull, "w")
+
+    function, _ = BENCHMARKS[name]
+    start = time.perf_counter()
+    files = function(folder)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+    sys.stdout = sys.__stdout__
+    print(
+        json.dumps(
+            {
+                "files": files,
+                "seconds": seconds,
+                "files_per_sec": files / seconds if seconds else None,
+                "peak_rss_mb": peak_rss_mb,
+            }
+        )
+    )
+
+
+def run_benchmark(name, corpus, learner_directory="csv"):
+    """Copies the export and runs one benchmark on it in a fresh interpreter."""
+    # The file catalog would hash every file and time SQLite writes, not the tools
+    env = dict(os.environ, LEARNER_DIRECTORY=learner_directory, FILE_CATALOG="")
+    if learner_directory == "csv":
+        env["LEARNER_DIRECTORY_PATH"] = os.path.join(corpus, "apprentice_info.csv")
+
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as work:
+        folder = os.path.join(work, "export")
+        shutil.copytree(os.path.join(corpus, "export"), folder)
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.run_benchmarks",
+                "--child",
+                name,
+                folder,
+            ],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_results(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(
+        f for f in os.listdir(RESULTS_DIR) if f.endswith(".json") and f != exclude
+    )
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':<28}{'files/sec':>12}{'peak MB':>10}{'vs base':>10}")
+    for name, result in results["benchmarks"].items():
+        if "error" in result:
+            print(f"{name:<28}{'error':>12}  {' '.join(result['error'])}")
+            continue
+        change = ""
+        base = (baseline or {}).get("benchmarks", {}).get(name, {})
+        if base.get("files_per_sec") and result["files_per_sec"]:
+            change = f"{result['files_per_sec'] / base['files_per_sec'] - 1:+.1%}"
+        print(
+            f"{name:<28}{result['files_per_sec']:>12.1f}"
+            f"{result['peak_rss_mb']:>10.1f}{change:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--learner-directory",
+        choices=["csv", "postgres"],
+        default="csv",
+        help="Where benchmarks look up learner names",
+    )
+    parser.add_argument(
+        "--no-lookups",
+        action="store_true",
+        help="Skip benchmarks that look up learner names",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Show the change against the most recent saved results",
+    )
+    parser.add_argument(
+        "--child", nargs=2, metavar=("NAME", "FOLDER"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    if not os.path.isdir(os.path.join(args.corpus, "export")):
+        parser.error(
+            f"No corpus at {args.corpus}; run python -m benchmarks.generate_corpus first."
+        )
+
+    with open(os.path.join(args.corpus, "corpus.json")) as f:
+        corpus = json.load(f)
+
+    names = args.only or [
+        name
+        for name, (_, needs_lookups) in BENCHMARKS.items()
+        if not (needs_lookups and args.no_lookups)
+    ]
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "corpus": corpus,
+        "learner_directory": args.learner_directory,
+        "benchmarks": {},
+    }
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        results["benchmarks"][name] = run_benchmark(
+            name, args.corpus, args.learner_directory
+        )
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filename = f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    with open(os.path.join(RESULTS_DIR, filename), "w") as f:
+        json.dump(results, f, indent=2)
+
+    print_results(results, previous_results(exclude=filename) if args.compare else None)
+    print(f"Saved results to {os.path.join(RESULTS_DIR, filename)}")
+
+
+if __name__ == "__main__":
+    main()
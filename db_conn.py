@@ -1,11 +1,12 @@
+import os
 import logging
 import psycopg2
 
-# Database connection details
-DB_HOST = "127.0.0.1"
-DB_NAME = "datamigrationmakers"
-DB_USER = "mattdoyle"
-DB_PASS = ""
+# Database connection details, overridable from the environment
+DB_HOST = os.environ.get("DB_HOST", "127.0.0.1")
+DB_NAME = os.environ.get("DB_NAME", "datamigrationmakers")
+DB_USER = os.environ.get("DB_USER", "mattdoyle")
+DB_PASS = os.environ.get("DB_PASS", "")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -1,9 +1,20 @@
 import os
+import time
 import logging
+import threading
 from json_to_csv_converter import JSONtoCSVConverter  # Import the JSON converter
 from db_conn import db_conn
 from html_to_pdf import html_to_pdf
 from pattern_recognition import Pattern_Recog
+from file_router import FileTypeRouter
+from zip_export_processor import zip_export_processor
+from file_catalog import record_move, record_output, flush_catalog, close_catalog
+from render_workers import RENDER_LIMIT_ERRORS, list_for_retry, render_isolated
+from learner_directory import (
+    DeferredFiles,
+    LearnerDirectoryUnavailable,
+    resolve_deferred,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +27,14 @@ DB_PASS = ""
 
 filename_counts = {}
 
+# Serialises picking a free filename and renaming onto it when files are
+# processed from several threads
+rename_lock = threading.Lock()
+
+# Files whose learner lookup hit an unavailable learner directory; retried at
+# the end of the run
+deferred_files = DeferredFiles()
+
 # Instantiate classes
 json_converter = JSONtoCSVConverter()
 db_conn = db_conn()
@@ -36,26 +55,61 @@ def increment_filename(directory, filename):
     return new_filename
 
 
+def convert_html_file(file_path):
+    """Converts an HTML file to PDF in a supervised render worker; returns the PDF path or None.
+
+    Raises one of RENDER_LIMIT_ERRORS when the render went over the time or
+    memory limit.
+    """
+    return render_isolated(htmlpdf.convert_html_file_to_pdf, file_path)
+
+
 def rename_file(file_path):
     """Renames a file and converts it if needed."""
     directory = os.path.dirname(file_path)
     filename = os.path.basename(file_path)
 
-    new_filename, is_html = Pattern_Recog.remove_unique_identifier(filename)
+    try:
+        new_filename, is_html = Pattern_Recog.remove_unique_identifier(filename)
+    except LearnerDirectoryUnavailable as e:
+        logger.warning(f"Deferred: {filename} (learner directory unavailable: {e})")
+        deferred_files.add(file_path)
+        return False
 
     if filename == new_filename:
         logger.info(f"Skipped: {filename} (No change. Not needed or no name found.)")
         return False
 
-    new_filename = increment_filename(directory, new_filename)
-
     try:
-        new_file_path = os.path.join(directory, new_filename)
-        os.rename(file_path, new_file_path)
+        with rename_lock:
+            new_filename = increment_filename(directory, new_filename)
+            new_file_path = os.path.join(directory, new_filename)
+            os.rename(file_path, new_file_path)
         logger.info(f"Renamed: {filename} -> {new_filename}")
+        record_move(file_path, new_file_path, tool="db_converter_3")
 
         if is_html:
-            pdf_file = htmlpdf.convert_html_file_to_pdf(new_file_path)
+            start = time.monotonic()
+            try:
+                pdf_file = convert_html_file(new_file_path)
+            except RENDER_LIMIT_ERRORS as e:
+                logger.warning(f"PDF render stopped for {new_file_path}: {e}")
+                record_output(
+                    new_file_path,
+                    None,
+                    "pdf",
+                    status="over_limit",
+                    tool="db_converter_3",
+                )
+                list_for_retry([new_file_path])
+                return True
+            record_output(
+                new_file_path,
+                pdf_file,
+                "pdf",
+                time.monotonic() - start,
+                tool="db_converter_3",
+            )
             if pdf_file:
                 logger.info(f"Converted HTML to PDF: {pdf_file}")
             else:
@@ -66,17 +120,24 @@ def rename_file(file_path):
         return False
 
 
+def convert_json_file(file_path):
+    """Converts a submission JSON file to CSV."""
+    json_converter.process_json_file(file_path)
+    return True
+
+
+# HTML renames also render a PDF, so they get their own pool and never hold
+# up cheap renames of other attachments
+router = FileTypeRouter()
+router.register("json", convert_json_file, extensions=[".json"], max_workers=2)
+router.register("html", rename_file, extensions=[".html"], max_workers=2)
+router.register("other", rename_file, max_workers=8, queue_depth=500, default=True)
+
+
 def process_individual_file(file_path):
     """Process a single file."""
     if os.path.isfile(file_path):
-        if file_path.endswith(".json"):
-            # Use the JSON to CSV converter for JSON files
-            try:
-                json_converter.process_json_file(file_path)
-            except Exception as e:
-                logger.error(f"Error processing JSON file '{file_path}': {e}")
-        else:
-            rename_file(file_path)
+        router.handle(file_path)
     else:
         logger.error(f"Error: The file '{file_path}' does not exist.")
 
@@ -90,6 +151,10 @@ def process_multiple_files(file_paths):
                 renamed_count += 1
         else:
             logger.warning(f"Skipped: '{file_path}' (file not found)")
+    renamed_count += resolve_deferred(
+        deferred_files, lambda paths: sum(1 for path in paths if rename_file(path))
+    )
+    flush_catalog()
     logger.info(f"Renamed {renamed_count} out of {len(file_paths)} files.")
 
 
@@ -99,25 +164,12 @@ def process_files_in_folder(folder_path):
         logger.error(f"The folder '{folder_path}' does not exist.")
         return
 
-    files = [
-        f
-        for f in os.listdir(folder_path)
-        if os.path.isfile(os.path.join(folder_path, f))
-    ]
-    renamed_count = 0
+    files = [entry.path for entry in os.scandir(folder_path) if entry.is_file()]
 
-    for filename in files:
-        file_path = os.path.join(folder_path, filename)
-        if file_path.endswith(".json"):
-            # Use the JSON to CSV converter for JSON files
-            try:
-                json_converter.process_json_file(file_path)
-                renamed_count += 1
-            except Exception as e:
-                logger.error(f"Error processing JSON file '{file_path}': {e}")
-        else:
-            if rename_file(file_path):
-                renamed_count += 1
+    renamed_count = router.dispatch(files)
+    renamed_count += resolve_deferred(deferred_files, router.dispatch)
+    router.log_metrics()
+    flush_catalog()
 
     logger.info(f"Processed {renamed_count} out of {len(files)} files in the folder.")
 
@@ -129,8 +181,9 @@ def main():
         print("1. Process a single file")
         print("2. Process multiple files")
         print("3. Process all files in a folder")
+        print("4. Process a ZIP export without extracting it")
 
-        choice = input("Enter your choice (1/2/3): ").strip()
+        choice = input("Enter your choice (1/2/3/4): ").strip()
 
         if choice == "1":
             file_path = input("Enter the full path of the file: ").strip()
@@ -149,6 +202,20 @@ def main():
         elif choice == "3":
             folder_path = input("Enter the folder path: ").strip()
             process_files_in_folder(folder_path)
+        elif choice == "4":
+            zip_path = input("Enter the path of the ZIP file: ").strip()
+            destination = input(
+                "Enter the destination folder, or a path ending in .zip: "
+            ).strip()
+            try:
+                zip_export_processor().process_zip(
+                    zip_path, destination, to_zip=destination.endswith(".zip")
+                )
+            except LearnerDirectoryUnavailable as e:
+                logger.error(
+                    f"{zip_path} left unprocessed; run again once the learner "
+                    f"directory is back: {str(e)}"
+                )
         else:
             print("Invalid choice. Please run the script again and choose 1 or 2.")
             continue
@@ -156,6 +223,8 @@ def main():
         restart = input("Start again? (y/n): ").strip().lower()
         if restart != "y":
             print("Exiting program.")
+            router.shutdown()
+            close_catalog()
             break
 
 
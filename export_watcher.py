@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from pattern_recognition import Pattern_Recog
+from learner_directory import seconds_until_retry
+from metrics import start_metrics_server
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Seconds a file's size and mtime must stay the same before it is processed
+SETTLE_SECONDS = 5
+# How often pending files are checked for having settled
+POLL_INTERVAL = 1
+# Number of files processed at the same time
+WORKERS = 4
+
+
+class _ExportEventHandler(FileSystemEventHandler):
+    """Passes every file event from watchdog on to the watcher."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.file_changed(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.file_changed(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.file_changed(event.dest_path)
+
+
+class ExportWatcher:
+    """Watches export folders and processes each file once it stops changing.
+
+    The processing function, its learner directory and caches live for the whole
+    watch, so each new file only pays for its own rename/conversion. Files the
+    pipeline put in `deferred` because the learner directory was unavailable
+    are queued again once its circuit breaker lets lookups through.
+    """
+
+    def __init__(
+        self,
+        folders,
+        process_file,
+        settle_seconds=SETTLE_SECONDS,
+        workers=WORKERS,
+        deferred=None,
+    ):
+        self.folders = folders
+        self.process_file = process_file
+        self.deferred = deferred
+        self.settle_seconds = settle_seconds
+        self.pattern_recog = Pattern_Recog()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.observer = Observer()
+        # path -> (size, mtime, time the file was last seen changing)
+        self.pending = {}
+        self.in_progress = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def wants(self, path):
+        """Only original export files are processed, never our own outputs."""
+        filename = os.path.basename(path)
+        if filename.endswith(".json"):
+            return True
+        return self.pattern_recog.parse_filename(filename) is not None
+
+    def file_changed(self, path):
+        if not self.wants(path):
+            return
+        with self.lock:
+            if path in self.in_progress:
+                return
+            self.pending[path] = (None, None, time.monotonic())
+
+    def initial_scan(self):
+        """Queues files that were already in the folders when the watch started."""
+        for folder in self.folders:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self.file_changed(entry.path)
+
+    def requeue_deferred(self):
+        """Queues deferred files again when the learner directory would take a lookup."""
+        if not self.deferred or seconds_until_retry():
+            return
+        paths = self.deferred.drain()
+        logger.info(f"Retrying {len(paths)} files deferred by the learner directory")
+        for path in paths:
+            self.file_changed(path)
+
+    def check_pending(self):
+        """Submits every pending file whose size and mtime have stopped changing."""
+        self.requeue_deferred()
+        now = time.monotonic()
+        ready = []
+
+        with self.lock:
+            for path, (size, mtime, last_change) in list(self.pending.items()):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    del self.pending[path]
+                    continue
+
+                if (stat.st_size, stat.st_mtime) != (size, mtime):
+                    self.pending[path] = (stat.st_size, stat.st_mtime, now)
+                elif now - last_change >= self.settle_seconds:
+                    del self.pending[path]
+                    self.in_progress.add(path)
+                    ready.append(path)
+
+        for path in ready:
+            self.executor.submit(self._run, path)
+
+    def _run(self, path):
+        start = time.monotonic()
+        try:
+            self.process_file(path)
+            logger.info(f"Processed {path} in {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"Error processing {path}: {str(e)}")
+        finally:
+            with self.lock:
+                self.in_progress.discard(path)
+
+    def run(self, initial_scan=False):
+        """Watches until interrupted."""
+        handler = _ExportEventHandler(self)
+        for folder in self.folders:
+            self.observer.schedule(handler, folder, recursive=False)
+            logger.info(f"Watching {folder}")
+        self.observer.start()
+
+        if initial_scan:
+            self.initial_scan()
+
+        try:
+            while not self.stopped.is_set():
+                self.check_pending()
+                self.stopped.wait(POLL_INTERVAL)
+        finally:
+            self.observer.stop()
+            self.observer.join()
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def build_pipeline(name):
+    """Returns (process_file, cleanup, deferred files) for the chosen converter script."""
+    if name == "snapshot":
+        import snapshot_converter
+
+        snapshot_converter.init_connection_pool()
+        return (
+            snapshot_converter.rename_file,
+            snapshot_converter.close_connection_pool,
+            snapshot_converter.deferred_files,
+        )
+
+    import db_converter_3
+
+    return (
+        db_converter_3.process_individual_file,
+        lambda: None,
+        db_converter_3.deferred_files,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch export folders and process new files as they land."
+    )
+    parser.add_argument("folders", nargs="+", help="Folders to watch")
+    parser.add_argument(
+        "--pipeline",
+        choices=["db_converter", "snapshot"],
+        default="db_converter",
+        help="Which converter processes each file",
+    )
+    parser.add_argument("--settle-seconds", type=float, default=SETTLE_SECONDS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument(
+        "--initial-scan",
+        action="store_true",
+        help="Also process files already in the folders",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve live Prometheus metrics on this port",
+    )
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            parser.error(f"The folder '{folder}' does not exist.")
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    process_file, cleanup, deferred = build_pipeline(args.pipeline)
+    watcher = ExportWatcher(
+        args.folders,
+        process_file,
+        settle_seconds=args.settle_seconds,
+        workers=args.workers,
+        deferred=deferred,
+    )
+    try:
+        watcher.run(initial_scan=args.initial_scan)
+    except KeyboardInterrupt:
+        logger.info("Stopping watcher.")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import os
+import re
+import time
+import atexit
+import sys
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def user_data_dir():
+    """Where this user's application data lives on each platform."""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(
+            os.path.join("~", "AppData", "Local")
+        )
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser(
+            os.path.join("~", ".local", "share")
+        )
+    return os.path.join(base, "activity-submissions")
+
+
+# The catalog database every entry point records into, kept with the user's
+# data rather than wherever a tool is run from; set to "" to turn it off
+FILE_CATALOG = os.environ.get(
+    "FILE_CATALOG", os.path.join(user_data_dir(), "file_catalog.sqlite3")
+)
+# Set FILE_CATALOG_HASH=0 to skip hashing file contents
+HASH_CONTENT = os.environ.get("FILE_CATALOG_HASH", "1") == "1"
+# Records held in memory before they are written in one transaction
+CATALOG_BATCH_SIZE = 200
+# Seconds another process may hold the write lock before a write gives up
+CATALOG_BUSY_TIMEOUT = 30
+HASH_CHUNK_BYTES = 1024 * 1024
+
+LEARNER_UUID_PATTERN = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.", re.I
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    tool TEXT,
+    original_path TEXT NOT NULL,
+    current_path TEXT NOT NULL UNIQUE,
+    learner_uuid TEXT,
+    content_hash TEXT,
+    size_bytes INTEGER,
+    output_path TEXT,
+    output_kind TEXT,
+    output_bytes INTEGER,
+    seconds REAL,
+    status TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_original_path ON files (original_path);
+CREATE INDEX IF NOT EXISTS files_learner_uuid ON files (learner_uuid);
+CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash);
+CREATE INDEX IF NOT EXISTS files_output_path ON files (output_path);
+"""
+
+# Starts a row for a file the catalog has not seen at this path yet
+INSERT_FILE = """
+INSERT OR IGNORE INTO files
+    (tool, original_path, current_path, learner_uuid, size_bytes, content_hash,
+     status, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, 'seen', ?)
+"""
+# A file moved or renamed. OR REPLACE drops a stale row that still claims the
+# destination path, e.g. a file that was since deleted outside the tools.
+MOVE_FILE = """
+UPDATE OR REPLACE files
+SET current_path = ?, size_bytes = COALESCE(?, size_bytes),
+    content_hash = COALESCE(?, content_hash), status = 'renamed', updated_at = ?
+WHERE current_path = ?
+"""
+RECORD_OUTPUT = """
+UPDATE files
+SET output_path = ?, output_kind = ?, output_bytes = ?, seconds = ?, status = ?,
+    updated_at = ?
+WHERE current_path = ?
+"""
+
+
+def learner_uuid_of(path):
+    """The learner application UUID an export filename starts with, or None."""
+    match = LEARNER_UUID_PATTERN.match(os.path.basename(path))
+    return match.group(1).lower() if match else None
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileCatalog:
+    """An indexed SQLite record of every file the tools have renamed, moved or converted.
+
+    Each row follows one file from its original export path to where it is
+    now and what was made from it. Records are queued and written in batches
+    of CATALOG_BATCH_SIZE, one transaction each, so a run does not pay a
+    commit per file; call flush() or close() at the end of a run. Several
+    processes can write to the same catalog.
+    """
+
+    def __init__(
+        self,
+        path=FILE_CATALOG,
+        batch_size=CATALOG_BATCH_SIZE,
+        hash_content=HASH_CONTENT,
+        tool=None,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.hash_content = hash_content
+        self.tool = tool
+        self.pid = os.getpid()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(
+            path, timeout=CATALOG_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # (sql, params) in the order they were recorded
+        self.pending = []
+        self.records = 0
+        # Paths this process moved files onto, which need no second hash
+        self.known = set()
+
+    def _describe(self, path):
+        """(size, content hash) for a file, with None for what cannot be had."""
+        try:
+            size = os.path.getsize(path)
+            digest = content_hash(path) if self.hash_content else None
+        except OSError:
+            return None, None
+        return size, digest
+
+    def _queue(self, *statements):
+        with self.lock:
+            self.pending.extend(statements)
+            self.records += 1
+            if self.records >= self.batch_size:
+                self._flush()
+
+    def _row_for(self, path, tool, now, describe=False):
+        size, digest = self._describe(path) if describe else (None, None)
+        return (
+            INSERT_FILE,
+            (tool or self.tool, path, path, learner_uuid_of(path), size, digest, now),
+        )
+
+    def record_move(self, before, after, tool=None):
+        """Records that the file at `before` is now at `after`."""
+        before, after = os.path.abspath(before), os.path.abspath(after)
+        now = time.time()
+        size, digest = self._describe(after)
+        with self.lock:
+            self.known.add(after)
+        self._queue(
+            self._row_for(before, tool, now),
+            (MOVE_FILE, (after, size, digest, now, before)),
+        )
+
+    def record_output(
+        self,
+        input_path,
+        output_path,
+        kind,
+        seconds=None,
+        status="converted",
+        tool=None,
+    ):
+        """Records a PDF or CSV made from input_path, or a failed attempt if output_path is None."""
+        input_path = os.path.abspath(input_path)
+        output_bytes = None
+        if output_path:
+            output_path = os.path.abspath(output_path)
+            try:
+                output_bytes = os.path.getsize(output_path)
+            except OSError:
+                pass
+        elif status == "converted":
+            status = "failed"
+        now = time.time()
+        with self.lock:
+            describe = input_path not in self.known
+        self._queue(
+            self._row_for(input_path, tool, now, describe=describe),
+            (
+                RECORD_OUTPUT,
+                (output_path, kind, output_bytes, seconds, status, now, input_path),
+            ),
+        )
+
+    def _flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        self.records = 0
+        try:
+            with self.conn:
+                for sql, params in pending:
+                    self.conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.error(
+                f"Could not write {len(pending)} catalog updates to {self.path}: {str(e)}"
+            )
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+    def query(self, sql, params=()):
+        self.flush()
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def outputs_for(self, path_or_uuid):
+        """(original path, current path, output path) for a file, or for all of a learner's files."""
+        key = path_or_uuid.lower()
+        if LEARNER_UUID_PATTERN.match(f"{key}."):
+            return self.query(
+                "SELECT original_path, current_path, output_path FROM files "
+                "WHERE learner_uuid = ? ORDER BY original_path",
+                (key,),
+            )
+        path = os.path.abspath(path_or_uuid)
+        return self.query(
+            "SELECT original_path, current_path, output_path FROM files "
+            "WHERE original_path = ? OR current_path = ?",
+            (path, path),
+        )
+
+    def learners_without_output(self, kind="pdf"):
+        """Learner UUIDs with files in the catalog but no successful output of this kind."""
+        rows = self.query(
+            "SELECT learner_uuid FROM files WHERE learner_uuid IS NOT NULL "
+            "GROUP BY learner_uuid "
+            "HAVING SUM(output_kind = ? AND status = 'converted') = 0 "
+            "ORDER BY learner_uuid",
+            (kind,),
+        )
+        return [row[0] for row in rows]
+
+
+_default_catalog = None
+_default_lock = threading.Lock()
+
+
+def get_catalog():
+    """This process's catalog, created on first use; None when FILE_CATALOG is empty."""
+    global _default_catalog
+    if not FILE_CATALOG:
+        return None
+    with _default_lock:
+        # A catalog opened before a fork belongs to the parent
+        if _default_catalog is None or _default_catalog.pid != os.getpid():
+            _default_catalog = FileCatalog()
+            atexit.register(_default_catalog.close)
+        return _default_catalog
+
+
+def flush_catalog():
+    """Writes anything still queued in this process's catalog."""
+    with _default_lock:
+        catalog = _default_catalog
+    if catalog is not None and catalog.pid == os.getpid():
+        catalog.flush()
+
+
+def close_catalog():
+    """Writes anything still queued and closes this process's catalog."""
+    global _default_catalog
+    with _default_lock:
+        if _default_catalog is not None and _default_catalog.pid == os.getpid():
+            atexit.unregister(_default_catalog.close)
+            _default_catalog.close()
+        _default_catalog = None
+
+
+def record_move(before, after, tool=None):
+    """Records a rename or move in the default catalog, if there is one."""
+    catalog = get_catalog()
+    if catalog is not None:
+        catalog.record_move(before, after, tool=tool)
+
+
+def record_output(
+    input_path, output_path, kind, seconds=None, status="converted", tool=None
+):
+    """Records a conversion in the default catalog, if there is one."""
+    catalog = get_catalog()
+    if catalog is not None:
+        catalog.record_output(
+            input_path, output_path, kind, seconds, status=status, tool=tool
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the processed file catalog.")
+    parser.add_argument(
+        "--catalog", default=FILE_CATALOG or None, required=not FILE_CATALOG
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    outputs_parser = subparsers.add_parser(
+        "outputs", help="What was made from a file, or from all of a learner's files"
+    )
+    outputs_parser.add_argument("path_or_uuid")
+    missing_parser = subparsers.add_parser(
+        "missing", help="Learners with no converted output"
+    )
+    missing_parser.add_argument("--kind", default="pdf", choices=["pdf", "csv"])
+
+    args = parser.parse_args()
+    catalog = FileCatalog(args.catalog)
+    try:
+        if args.command == "outputs":
+            for original_path, current_path, output_path in catalog.outputs_for(
+                args.path_or_uuid
+            ):
+                print(f"{original_path} -> {current_path} -> {output_path or '-'}")
+        else:
+            for learner_uuid in catalog.learners_without_output(args.kind):
+                print(learner_uuid)
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FileRoute:
+    """One file type: its handler, worker pool, queue limit and counters."""
+
+    def __init__(self, name, extensions, handler, max_workers, queue_depth):
+        self.name = name
+        self.extensions = extensions
+        self.handler = handler
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.executor = None
+        # Bounds how many files can be waiting on or running in the pool
+        self.slots = threading.BoundedSemaphore(max_workers + queue_depth)
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"route-{self.name}"
+            )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def run(self, file_path):
+        """Runs the handler on one file and records how it went."""
+        start = time.monotonic()
+        try:
+            result = self.handler(file_path)
+            ok = bool(result)
+        except Exception as e:
+            logger.error(f"[{self.name}] Error processing '{file_path}': {e}")
+            ok = False
+
+        elapsed = time.monotonic() - start
+        with self.lock:
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        return ok
+
+    def _run_and_release(self, file_path):
+        try:
+            return self.run(file_path)
+        finally:
+            self.slots.release()
+
+    def submit(self, file_path):
+        """Queues a file, blocking while this route's queue is full."""
+        self.slots.acquire()
+        with self.lock:
+            self.submitted += 1
+        return self.executor.submit(self._run_and_release, file_path)
+
+    def metrics(self):
+        with self.lock:
+            done = self.succeeded + self.failed
+            return {
+                "submitted": self.submitted,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "queued": self.submitted - done,
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "avg_seconds": self.total_seconds / done if done else 0.0,
+                "max_seconds": self.max_seconds,
+            }
+
+
+class FileTypeRouter:
+    """Maps file extensions to handlers, each running on its own worker pool.
+
+    A slow file type only ever queues behind itself, and new types are added
+    with register() without changing the code that walks the folder.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.by_extension = {}
+        self.default_route = None
+
+    def register(
+        self,
+        name,
+        handler,
+        extensions=(),
+        max_workers=1,
+        queue_depth=100,
+        default=False,
+    ):
+        """Adds a route. The handler takes a file path and returns True on success."""
+        route = FileRoute(name, extensions, handler, max_workers, queue_depth)
+        self.routes[name] = route
+        for extension in extensions:
+            self.by_extension[extension.lower()] = route
+        if default:
+            self.default_route = route
+        return route
+
+    def route_for(self, file_path):
+        extension = os.path.splitext(file_path)[1].lower()
+        return self.by_extension.get(extension, self.default_route)
+
+    def handle(self, file_path):
+        """Processes one file on the calling thread."""
+        route = self.route_for(file_path)
+        if route is None:
+            logger.warning(f"Skipped: '{file_path}' (no handler for this file type)")
+            return False
+        with route.lock:
+            route.submitted += 1
+        return route.run(file_path)
+
+    def dispatch(self, file_paths):
+        """Processes many files on the route pools and returns how many succeeded.
+
+        Each route is fed from its own thread, so a full queue for one type
+        never holds back files of another type.
+        """
+        grouped = {}
+        for file_path in file_paths:
+            route = self.route_for(file_path)
+            if route is None:
+                logger.warning(
+                    f"Skipped: '{file_path}' (no handler for this file type)"
+                )
+                continue
+            grouped.setdefault(route.name, []).append(file_path)
+
+        futures = []
+        futures_lock = threading.Lock()
+
+        def feed(route, paths):
+            for file_path in paths:
+                future = route.submit(file_path)
+                with futures_lock:
+                    futures.append(future)
+
+        feeders = []
+        for name, paths in grouped.items():
+            route = self.routes[name]
+            route.start()
+            feeder = threading.Thread(
+                target=feed, args=(route, paths), name=f"feed-{name}"
+            )
+            feeder.start()
+            feeders.append(feeder)
+
+        for feeder in feeders:
+            feeder.join()
+
+        return sum(1 for future in futures if future.result())
+
+    def shutdown(self):
+        for route in self.routes.values():
+            route.shutdown()
+
+    def metrics(self):
+        return {name: route.metrics() for name, route in self.routes.items()}
+
+    def log_metrics(self):
+        for name, stats in self.metrics().items():
+            if stats["submitted"] or stats["succeeded"] or stats["failed"]:
+                logger.info(
+                    f"[{name}] {stats['succeeded']} ok, {stats['failed']} failed, "
+                    f"avg {stats['avg_seconds']:.2f}s, max {stats['max_seconds']:.2f}s"
+                )
@@ -0,0 +1,241 @@
+import os
+import re
+import sys
+import logging
+import numpy as np
+from pattern_recognition import FILENAME_PATTERNS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COMPILED_PATTERNS = [re.compile(pattern) for pattern in FILENAME_PATTERNS]
+# The export timestamp; some exports only have one digit for the seconds
+TIMESTAMP_PATTERN = re.compile(r"\.(\d{8})T(\d{5,6})-(\d{3})Z(?:\.|$)")
+# The same, found line by line in a newline-joined listing
+TIMESTAMP_SCAN = re.compile(TIMESTAMP_PATTERN.pattern, re.M)
+# Where the dashes are in a UUID
+UUID_DASHES = [8, 13, 18, 23]
+
+
+def _empty_table(size, text_width=1):
+    return np.zeros(
+        size,
+        dtype=[
+            ("filename", f"U{text_width}"),
+            ("uuid", "U36"),
+            ("secondary_uuid", "U36"),
+            ("timestamp", "datetime64[ms]"),
+            ("description", f"U{text_width}"),
+            ("extension", "U16"),
+            ("pattern", "i1"),
+        ],
+    )
+
+
+def parse_timestamps(timestamps):
+    """Converts 'YYYYMMDDTHHMMSS-mmm' strings to datetime64[ms] in one pass.
+
+    Empty strings become NaT. Works on the raw digits rather than calling
+    strptime once per value.
+    """
+    timestamps = np.asarray(timestamps, dtype="S19")
+    result = np.full(len(timestamps), np.datetime64("NaT"), dtype="datetime64[ms]")
+    present = np.char.str_len(timestamps) == 19
+    if not present.any():
+        return result
+
+    digits = timestamps[present].view(np.uint8).reshape(-1, 19).astype(np.int64) - ord(
+        "0"
+    )
+
+    def number(start, end):
+        value = np.zeros(len(digits), dtype=np.int64)
+        for column in range(start, end):
+            value = value * 10 + digits[:, column]
+        return value
+
+    years = number(0, 4)
+    months = number(4, 6)
+    days = number(6, 8)
+    milliseconds = (
+        number(9, 11) * 3600 + number(11, 13) * 60 + number(13, 15)
+    ) * 1000 + number(16, 19)
+
+    dates = (
+        (years - 1970).astype("datetime64[Y]") + (months - 1).astype("timedelta64[M]")
+    ).astype("datetime64[D]") + (days - 1).astype("timedelta64[D]")
+    result[present] = dates.astype("datetime64[ms]") + milliseconds.astype(
+        "timedelta64[ms]"
+    )
+    return result
+
+
+def _find_timestamps(filenames):
+    """Where TIMESTAMP_PATTERN first matches in each filename, or -1.
+
+    One regex scan over the newline-joined listing instead of a search per
+    filename. The few names with a newline of their own are searched singly.
+    """
+    lengths = np.fromiter(map(len, filenames), dtype=np.int64, count=len(filenames))
+    line_starts = np.concatenate(([0], np.cumsum(lengths[:-1] + 1)))
+    text = "\n".join(filenames)
+    multiline = text.count("\n") != len(filenames) - 1
+    if multiline:
+        text = "\n".join(filename.replace("\n", "\0") for filename in filenames)
+
+    found = np.fromiter(map(re.Match.start, TIMESTAMP_SCAN.finditer(text)), np.int64)
+    rows = np.searchsorted(line_starts, found, side="right") - 1
+    rows, first = np.unique(rows, return_index=True)
+    starts = np.full(len(filenames), -1, dtype=np.int64)
+    starts[rows] = found[first] - line_starts[rows]
+
+    if multiline:
+        for row, filename in enumerate(filenames):
+            if "\n" in filename:
+                match = TIMESTAMP_PATTERN.search(filename)
+                starts[row] = match.start() if match else -1
+    return starts
+
+
+def _match_patterns(filenames, candidates):
+    """Index of the first of FILENAME_PATTERNS each filename matches, or -1.
+
+    Each pattern is run through map() over only the candidates no earlier
+    pattern matched, which gives the same answer as trying the patterns in
+    turn for every filename, without the Python loop around each match.
+    """
+    pattern = np.full(len(filenames), -1, dtype=np.int8)
+    remaining = np.flatnonzero(candidates)
+    names = np.array(filenames, dtype=object)
+    for index, compiled in enumerate(COMPILED_PATTERNS):
+        if not len(remaining):
+            break
+        hits = np.fromiter(
+            map(bool, map(compiled.match, names[remaining])),
+            dtype=bool,
+            count=len(remaining),
+        )
+        pattern[remaining[hits]] = index
+        remaining = remaining[~hits]
+    return pattern
+
+
+def _is_uuid(chars):
+    """True for each row of 36 code points that spells a lower-case UUID."""
+    hex_digit = ((chars >= ord("0")) & (chars <= ord("9"))) | (
+        (chars >= ord("a")) & (chars <= ord("f"))
+    )
+    dashes = np.zeros(36, dtype=bool)
+    dashes[UUID_DASHES] = True
+    return np.where(dashes, chars == ord("-"), hex_digit).all(axis=1)
+
+
+def parse_filenames(filenames):
+    """Parses many export filenames into one NumPy structured array.
+
+    Columns: filename, uuid, secondary_uuid, timestamp (datetime64[ms]),
+    description, extension and pattern (index into FILENAME_PATTERNS, or -1
+    if nothing matched).
+
+    Timestamps are found with one regex scan over the whole listing, only
+    names with a timestamp are tried against the patterns, and the columns
+    are cut out of a code point matrix of the names, so the work for each
+    filename happens in C rather than in a Python loop.
+    """
+    filenames = list(filenames)
+    text_width = max([1] + [len(filename) for filename in filenames])
+    table = _empty_table(len(filenames), text_width)
+    if not filenames:
+        return table
+    # One row of code points per name, wide enough for both UUIDs
+    names = np.array(filenames, dtype=f"U{max(text_width, 73)}")
+    table["filename"] = names
+    table["timestamp"] = np.datetime64("NaT")
+
+    # Every pattern contains an export timestamp
+    stamp_starts = _find_timestamps(filenames)
+    table["pattern"] = _match_patterns(filenames, stamp_starts >= 0)
+    rows = np.flatnonzero(table["pattern"] >= 0)
+    if not len(rows):
+        return table
+
+    names = names[rows]
+    chars = names.view(np.uint32).reshape(len(rows), -1)
+    table["uuid"][rows] = np.ascontiguousarray(chars[:, :36]).view("U36").ravel()
+    secondary = np.ascontiguousarray(chars[:, 37:73])
+    table["secondary_uuid"][rows] = np.where(
+        _is_uuid(secondary), secondary.view("U36").ravel(), ""
+    )
+
+    # os.path.splitext: the extension follows the last dot
+    dots = np.strings.rfind(names, ".")
+    table["extension"][rows] = np.strings.slice(names, dots + 1, None)
+
+    # Rebuild 'YYYYMMDDTHHMMSS-mmm' from the digits around each match; a
+    # five digit time has its dash where the sixth digit would be
+    starts = stamp_starts[rows]
+    line = np.arange(len(rows))
+    lines = line[:, None]
+    five = chars[line, starts + 15] == ord("-")
+    time_offsets = np.where(
+        five[:, None], [10, 11, 12, 13, 13, 14], [10, 11, 12, 13, 14, 15]
+    )
+    stamp = np.empty((len(rows), 19), dtype=np.uint8)
+    stamp[:, 0:8] = chars[lines, starts[:, None] + np.arange(1, 9)]
+    stamp[:, 8] = ord("T")
+    stamp[:, 9:15] = chars[lines, starts[:, None] + time_offsets]
+    # Read five digit times the way strptime does: HHMM then S
+    stamp[five, 13] = ord("0")
+    stamp[:, 15] = ord("-")
+    millis = starts + np.where(five, 16, 17)
+    stamp[:, 16:19] = chars[lines, millis[:, None] + np.arange(3)]
+    table["timestamp"][rows] = parse_timestamps(stamp.view("S19").ravel())
+
+    # The description runs from after the timestamp (and its dot) to the
+    # extension's dot
+    stamp_end = millis + 4
+    after_stamp = chars[line, np.minimum(stamp_end, chars.shape[1] - 1)]
+    stamp_end += after_stamp == ord(".")
+    table["description"][rows] = np.strings.slice(names, stamp_end, dots)
+    return table
+
+
+def parse_directory(folder):
+    """Parses every file name in a folder with a single directory scan."""
+    with os.scandir(folder) as entries:
+        names = [entry.name for entry in entries if entry.is_file()]
+    return parse_filenames(names)
+
+
+def summarise(table):
+    """Counts that are useful when planning a run over an export."""
+    matched = table[table["pattern"] >= 0]
+    patterns, pattern_counts = np.unique(table["pattern"], return_counts=True)
+    extensions, extension_counts = np.unique(matched["extension"], return_counts=True)
+    learners, files_per_learner = np.unique(matched["uuid"], return_counts=True)
+    stamped = matched["timestamp"][~np.isnat(matched["timestamp"])]
+
+    return {
+        "files": len(table),
+        "matched": len(matched),
+        "learners": len(learners),
+        "by_pattern": dict(zip(patterns.tolist(), pattern_counts.tolist())),
+        "by_extension": dict(zip(extensions.tolist(), extension_counts.tolist())),
+        "max_files_per_learner": int(files_per_learner.max()) if len(learners) else 0,
+        "earliest": str(stamped.min()) if len(stamped) else None,
+        "latest": str(stamped.max()) if len(stamped) else None,
+    }
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python filename_table.py <folder>")
+        return
+
+    table = parse_directory(sys.argv[1])
+    for key, value in summarise(table).items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
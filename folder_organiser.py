@@ -1,32 +1,195 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import send2trash
+from pattern_recognition import Pattern_Recog
+from learner_directory import LearnerDirectoryUnavailable
+from file_catalog import record_move, flush_catalog, close_catalog
+
+# Number of learner folders whose moves run at the same time
+MOVE_WORKERS = 8
 
 
 class folder_organiser:
-    def organise_files(self, directory):
-        files = [
-            f
-            for f in os.listdir(directory)
-            if os.path.isfile(os.path.join(directory, f))
-        ]
-
-        for file in files:
-            words = file.split()[:2]
-            if len(words) < 2:
-                print(f"Skipping {file}: not enough words in filename.")
+    def __init__(self):
+        self.pattern_recog = Pattern_Recog()
+
+    def plan_moves(self, directory):
+        """Scans the directory once and groups files by their destination folder.
+
+        Returns a mapping of folder name to (source name, destination name) pairs
+        and the list of files that could not be placed.
+        """
+        groups = {}
+        skipped = []
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+
+                words = entry.name.split()[:2]
+                if len(words) < 2:
+                    skipped.append(entry.name)
+                    continue
+
+                groups.setdefault(" ".join(words), []).append((entry.name, entry.name))
+
+        return groups, skipped
+
+    def plan_moves_by_learner(self, directory):
+        """Groups original export files by learner UUID and renames them on the way.
+
+        Learner names come from one bulk lookup, so renaming and organising
+        happen in a single pass over the folder.
+        """
+        parsed_files = []
+        existing_folders = set()
+        skipped = []
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    existing_folders.add(entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+
+                parsed = self.pattern_recog.parse_filename(entry.name)
+                if parsed is None or not self.pattern_recog.has_valid_uuid(parsed):
+                    skipped.append(entry.name)
+                    continue
+                parsed_files.append((entry.name, parsed))
+
+        learner_names = self.pattern_recog.get_learner_names(
+            {parsed["uuid"] for _, parsed in parsed_files}
+        )
+
+        groups = {}
+        taken = {}
+        for filename, parsed in parsed_files:
+            learner_name = learner_names.get(parsed["uuid"])
+            if not learner_name:
+                skipped.append(filename)
                 continue
 
-            folder_name = " ".join(words)
-            folder_path = os.path.join(directory, folder_name)
+            if learner_name not in taken:
+                folder_path = os.path.join(directory, learner_name)
+                taken[learner_name] = (
+                    set(os.listdir(folder_path))
+                    if learner_name in existing_folders
+                    else set()
+                )
 
-            if not os.path.exists(folder_path):
-                os.makedirs(folder_path)
+            new_filename = self.pattern_recog.format_filename(parsed, learner_name)
+            new_filename = self._unique_name(new_filename, taken[learner_name])
+            groups.setdefault(learner_name, []).append((filename, new_filename))
 
-            source = os.path.join(directory, file)
-            destination = os.path.join(folder_path, file)
-            shutil.move(source, destination)
-            print(f"Moved {file} to {folder_name}")
+        return groups, skipped
+
+    @staticmethod
+    def _unique_name(filename, taken):
+        """Increments the filename until it does not clash with a planned or existing file."""
+        base, ext = os.path.splitext(filename)
+        new_filename = filename
+        counter = 1
+        while new_filename in taken:
+            new_filename = f"{base}({counter}){ext}"
+            counter += 1
+        taken.add(new_filename)
+        return new_filename
+
+    @staticmethod
+    def _move_batch(directory, folder_name, moves):
+        """Moves one folder's worth of files and returns (moved, failed) counts.
+
+        A file that cannot be moved is reported and the rest of the batch carries on.
+        """
+        folder_path = os.path.join(directory, folder_name)
+        try:
+            os.makedirs(folder_path, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating folder {folder_name}: {str(e)}")
+            return 0, len(moves)
+
+        moved = 0
+        failed = 0
+        for source, destination in moves:
+            source_path = os.path.join(directory, source)
+            destination_path = os.path.join(folder_path, destination)
+            try:
+                os.rename(source_path, destination_path)
+            except OSError as e:
+                print(f"Error moving {source} to {folder_name}: {str(e)}")
+                failed += 1
+                continue
+            record_move(source_path, destination_path, tool="folder_organiser")
+            moved += 1
+        return moved, failed
+
+    @staticmethod
+    def preview_moves(groups):
+        """Prints the planned moves without touching the filesystem."""
+        for folder_name in sorted(groups):
+            moves = groups[folder_name]
+            print(f"{folder_name}/ ({len(moves)} files)")
+            for source, destination in sorted(moves):
+                if source == destination:
+                    print(f"    {source}")
+                else:
+                    print(f"    {source} -> {destination}")
+        total = sum(len(moves) for moves in groups.values())
+        print(f"Dry run: {total} files would be moved into {len(groups)} folders.")
+
+    def organise_files(
+        self, directory, dry_run=False, max_workers=MOVE_WORKERS, group_by="name"
+    ):
+        """Moves files into one folder per learner.
+
+        group_by="name" uses the first two words of already renamed files;
+        group_by="uuid" works on the original export filenames and renames
+        each file as it is moved. It raises LearnerDirectoryUnavailable, before
+        anything is moved, when the learner names cannot be looked up.
+        """
+        if group_by == "uuid":
+            groups, skipped = self.plan_moves_by_learner(directory)
+            skip_reason = "no learner found for filename."
+        else:
+            groups, skipped = self.plan_moves(directory)
+            skip_reason = "not enough words in filename."
+
+        for file in skipped:
+            print(f"Skipping {file}: {skip_reason}")
+
+        if dry_run:
+            self.preview_moves(groups)
+            return groups
+
+        total_moved = 0
+        total_failed = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._move_batch, directory, folder_name, moves
+                ): folder_name
+                for folder_name, moves in groups.items()
+            }
+            for future in as_completed(futures):
+                folder_name = futures[future]
+                moved, failed = future.result()
+                total_moved += moved
+                total_failed += failed
+                if failed:
+                    print(f"Moved {moved} files to {folder_name}, {failed} failed")
+                else:
+                    print(f"Moved {moved} files to {folder_name}")
+
+        flush_catalog()
+        print(
+            f"Total files moved: {total_moved} into {len(groups)} folders, "
+            f"{total_failed} failed"
+        )
+        return groups
 
     @staticmethod
     def merge_folders(source_paths, destination_name):
@@ -67,6 +230,7 @@ class folder_organiser:
                                 continue
 
                             shutil.move(source_file, dest_file)
+                            record_move(source_file, dest_file, tool="folder_organiser")
                             print(f"Moved {file} to {destination_name}")
                             file_count += 1
 
@@ -78,6 +242,7 @@ class folder_organiser:
                     print(f"Error processing folder {source_path}: {str(e)}")
             else:
                 print(f"Source folder not found: {source_path}")
+        flush_catalog()
         print(f"Total files moved: {file_count} of {total_files}")
 
 
@@ -86,9 +251,11 @@ def main():
         print("\nChoose an option:")
         print("1. Process a folder to organise its files")
         print("2. Process multiple folders to merge them into one folder")
-        print("3. Exit")
+        print("3. Preview how a folder would be organised (dry run)")
+        print("4. Rename and organise original export files by learner")
+        print("5. Exit")
 
-        choice = input("Enter your choice (1/2/3): ").strip()
+        choice = input("Enter your choice (1/2/3/4/5): ").strip()
 
         if choice == "1":
             print("Enter the folder path:")
@@ -116,7 +283,26 @@ def main():
             else:
                 print("No source paths provided!")
         elif choice == "3":
+            print("Enter the folder path:")
+            directory = input().strip()
+            organiser = folder_organiser()
+            organiser.organise_files(directory, dry_run=True)
+        elif choice == "4":
+            print("Enter the folder path:")
+            directory = input().strip()
+            organiser = folder_organiser()
+            try:
+                organiser.organise_files(directory, dry_run=True, group_by="uuid")
+                if input("Apply these moves? (y/n): ").strip().lower() == "y":
+                    organiser.organise_files(directory, group_by="uuid")
+            except LearnerDirectoryUnavailable as e:
+                print(
+                    f"The learner directory is unavailable, so nothing was moved; "
+                    f"try again once it is back: {str(e)}"
+                )
+        elif choice == "5":
             print("Exiting program...")
+            close_catalog()
             break
         else:
             print("Invalid choice, please try again")
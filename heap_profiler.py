@@ -0,0 +1,302 @@
+import os
+import glob
+import json
+import time
+import logging
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+import psutil
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set PROFILE_MEMORY=1 to trace Python allocations and log where the heap grows
+PROFILE_MEMORY = os.environ.get("PROFILE_MEMORY") == "1"
+# Files processed between snapshots
+PROFILE_INTERVAL_FILES = int(os.environ.get("PROFILE_INTERVAL_FILES", 200))
+# Stack frames kept per allocation; more than 1 groups sites by full traceback,
+# which is slower but shows who called the allocating line
+PROFILE_FRAMES = int(os.environ.get("PROFILE_FRAMES", 1))
+# Allocation sites listed per report
+PROFILE_TOP_SITES = 10
+# Largest files listed per interval
+PROFILE_TOP_FILES = 3
+# Each profiled process writes its totals here when it stops, so the run can
+# log one summary across the main process and its render workers
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "heap_profiles")
+)
+
+# Allocations made by the profiler itself or the import system are not leaks
+IGNORED_TRACES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _mb(size):
+    if abs(size) < 1024 * 1024:
+        return f"{size / 1024:+.1f} KB"
+    return f"{size / 1024 / 1024:+.1f} MB"
+
+
+def _site(statistic):
+    # The most recent frame: the line that made the allocation
+    frame = statistic.traceback[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+class HeapProfiler:
+    """Takes a tracemalloc snapshot every interval_files files and logs what grew.
+
+    Each report compares the heap with the previous snapshot: the allocation
+    sites that grew most, how much the traced heap and RSS grew per file,
+    and which files were processed in that interval. RSS growing while the
+    traced heap does not points at native memory (pango, cairo) rather than
+    Python objects. summary() ranks sites by how many intervals they grew
+    in, which picks out steady leaks from one-off caches filling up.
+    """
+
+    def __init__(
+        self,
+        interval_files=PROFILE_INTERVAL_FILES,
+        frames=PROFILE_FRAMES,
+        top_sites=PROFILE_TOP_SITES,
+    ):
+        self.interval_files = interval_files
+        self.frames = frames
+        self.key_type = "traceback" if frames > 1 else "lineno"
+        self.top_sites = top_sites
+        self.lock = threading.Lock()
+        self.process = psutil.Process(os.getpid())
+
+        # (path, size) of the files processed since the last snapshot
+        self.files = []
+        self.intervals = 0
+        self.files_total = 0
+        # site -> total growth, and the number of intervals it grew in
+        self.site_growth = Counter()
+        self.site_intervals = Counter()
+        self.site_names = {}
+
+        tracemalloc.start(frames)
+        self.started = time.monotonic()
+        self.previous = self._snapshot()
+        self.previous_rss = self.process.memory_info().rss
+        logger.info(
+            f"Heap profiling on: snapshot every {interval_files} files, "
+            f"{frames} frame(s) per allocation"
+        )
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+
+    @contextmanager
+    def track(self, path):
+        """Counts the file towards the current interval once the block has run."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.files.append((path, size))
+                due = len(self.files) >= self.interval_files
+            if due:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Snapshots the heap now and logs the growth since the last snapshot."""
+        with self.lock:
+            files, self.files = self.files, []
+            if not files:
+                return
+            snapshot = self._snapshot()
+            rss = self.process.memory_info().rss
+            stats = snapshot.compare_to(self.previous, self.key_type)
+            self.previous = snapshot
+            rss_growth = rss - self.previous_rss
+            self.previous_rss = rss
+            self.intervals += 1
+            self.files_total += len(files)
+
+            for statistic in stats:
+                if statistic.size_diff:
+                    key = statistic.traceback
+                    self.site_growth[key] += statistic.size_diff
+                    self.site_intervals[key] += statistic.size_diff > 0
+                    self.site_names.setdefault(key, _site(statistic))
+
+        growth = sum(statistic.size_diff for statistic in stats)
+        input_bytes = sum(size for _, size in files)
+        kinds = Counter(
+            os.path.splitext(path)[1].lower() or "none" for path, _ in files
+        )
+        largest = sorted(files, key=lambda item: item[1], reverse=True)
+        lines = [
+            f"Heap profile #{self.intervals}: {len(files)} files "
+            f"({input_bytes / 1024 / 1024:.1f} MB; "
+            + ", ".join(f"{count} {kind}" for kind, count in kinds.most_common(4))
+            + f") -> traced heap {_mb(growth)} ({growth / len(files) / 1024:+.1f} KB/file), "
+            f"RSS {_mb(rss_growth)}",
+            "  largest files: "
+            + ", ".join(
+                f"{os.path.basename(path)} ({size / 1024:.0f} KB)"
+                for path, size in largest[:PROFILE_TOP_FILES]
+            ),
+        ]
+        for statistic in sorted(stats, key=lambda s: s.size_diff, reverse=True)[
+            : self.top_sites
+        ]:
+            if statistic.size_diff <= 0:
+                break
+            lines.append(
+                f"  {_mb(statistic.size_diff)} ({statistic.count_diff:+d} blocks) "
+                f"{_site(statistic)}"
+            )
+            if self.key_type == "traceback":
+                lines.extend(
+                    f"      {line}" for line in statistic.traceback.format()[-6:]
+                )
+        logger.info("\n".join(lines))
+
+    def summary(self):
+        """Logs the sites that kept growing over the whole run."""
+        self.checkpoint()
+        with self.lock:
+            if not self.intervals:
+                return
+            ranked = sorted(
+                self.site_growth,
+                key=lambda key: (self.site_intervals[key], self.site_growth[key]),
+                reverse=True,
+            )
+            lines = [
+                f"Heap profile summary: {self.files_total} files over "
+                f"{self.intervals} intervals in {time.monotonic() - self.started:.0f}s; "
+                f"sites that grew in the most intervals:"
+            ]
+            for key in ranked[: self.top_sites]:
+                if self.site_growth[key] <= 0:
+                    continue
+                lines.append(
+                    f"  grew in {self.site_intervals[key]}/{self.intervals}, "
+                    f"{_mb(self.site_growth[key])} in total: {self.site_names[key]}"
+                )
+        logger.info("\n".join(lines))
+
+    def save(self, directory=PROFILE_DIR):
+        """Writes this process's totals to heap-<pid>.json for merge_profiles()."""
+        with self.lock:
+            if not self.intervals:
+                return
+            record = {
+                "pid": self.process.pid,
+                "files": self.files_total,
+                "intervals": self.intervals,
+                # [site, total growth, intervals it grew in]
+                "sites": [
+                    [self.site_names[key], growth, self.site_intervals[key]]
+                    for key, growth in self.site_growth.items()
+                ],
+            }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"heap-{record['pid']}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(f"{path}.tmp", path)
+
+    def stop(self):
+        self.summary()
+        self.save()
+        tracemalloc.stop()
+
+
+def merge_profiles(since=0, directory=PROFILE_DIR, top_sites=PROFILE_TOP_SITES):
+    """Logs one summary across the per-process profiles written since `since`.
+
+    The files merged are removed, so the next run starts clean.
+    """
+    records = []
+    for path in glob.glob(os.path.join(directory, "heap-*.json")):
+        try:
+            if os.path.getmtime(path) < since:
+                continue
+            with open(path, encoding="utf-8") as f:
+                records.append(json.load(f))
+            os.remove(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping heap profile {path}: {str(e)}")
+    if len(records) < 2:
+        return
+
+    site_growth = Counter()
+    site_intervals = Counter()
+    for record in records:
+        for site, growth, intervals in record["sites"]:
+            site_growth[site] += growth
+            site_intervals[site] += intervals
+    intervals = sum(record["intervals"] for record in records)
+    ranked = sorted(
+        site_growth,
+        key=lambda site: (site_intervals[site], site_growth[site]),
+        reverse=True,
+    )
+    lines = [
+        f"Heap profile across {len(records)} processes: "
+        f"{sum(record['files'] for record in records)} files over {intervals} "
+        f"intervals; sites that grew in the most intervals:"
+    ]
+    for site in ranked[:top_sites]:
+        if site_growth[site] <= 0:
+            continue
+        lines.append(
+            f"  grew in {site_intervals[site]}/{intervals}, "
+            f"{_mb(site_growth[site])} in total: {site}"
+        )
+    logger.info("\n".join(lines))
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """This process's heap profiler when PROFILE_MEMORY is set, otherwise None."""
+    global _profiler
+    if not PROFILE_MEMORY:
+        return None
+    with _profiler_lock:
+        # Render workers are forked; each traces its own heap
+        if _profiler is None or _profiler.process.pid != os.getpid():
+            _profiler = HeapProfiler()
+        return _profiler
+
+
+def track_file(path):
+    """Wraps the processing of one file; does nothing unless profiling is on."""
+    profiler = get_profiler()
+    return profiler.track(path) if profiler is not None else nullcontext()
+
+
+def stop_profiler(merge_workers=False):
+    """Logs the run summary and stops tracing in this process.
+
+    With merge_workers, also logs a summary across this process and the
+    render workers that saved their profiles since it started.
+    """
+    global _profiler
+    with _profiler_lock:
+        profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.process.pid == os.getpid():
+        profiler.stop()
+    if merge_workers and PROFILE_MEMORY:
+        merge_profiles(since=psutil.Process(os.getpid()).create_time())
@@ -1,8 +1,218 @@
-from flask import Flask
+import os
+import re
+import queue
+from concurrent.futures import TimeoutError
+from flask import Flask, Response, abort, jsonify, request, send_file, url_for
+import db_converter_3
+from job_queue import JobQueue, format_sse
+from metrics import CONTENT_TYPE, REGISTRY
+from render_service import PDFRenderCache
+from render_workers import RENDER_LIMIT_ERRORS, RenderWorkerDied
 
 app = Flask(__name__)
 
+# Folders and HTML files named in requests must be inside this directory,
+# and rendered documents may only load local files from it; relative paths
+# are taken from it
+API_ROOT = os.path.realpath(
+    os.environ.get(
+        "API_ROOT",
+        os.path.join(os.path.expanduser("~"), "Desktop", "Activity Submissions"),
+    )
+)
+
+# Started with the app so the workers stay warm between requests
+jobs = JobQueue()
+renders = PDFRenderCache(file_root=API_ROOT)
+
+# How long a render request waits before answering 202 and letting the
+# client fetch the PDF later
+RENDER_WAIT_SECONDS = 30
+# Rendered PDFs are named by content hash, so they never change
+RENDER_MAX_AGE = 365 * 24 * 60 * 60
+
+job_queue_depth = REGISTRY.gauge(
+    "jobs_queue_depth", "Jobs waiting for a worker to pick them up."
+)
+jobs_by_status = REGISTRY.gauge("jobs", "Known jobs, by status.", ["status"])
+render_cache_lookups = REGISTRY.gauge(
+    "render_cache_lookups", "PDF render cache lookups, by result.", ["result"]
+)
+route_files = REGISTRY.gauge(
+    "router_files",
+    "Files handled by each file-type route, by state.",
+    ["route", "state"],
+)
+
+
+def _collect_app_metrics():
+    job_queue_depth.set(jobs.queue_depth())
+    counts = {"queued": 0, "running": 0, "finished": 0, "failed": 0}
+    for job in jobs.all_jobs():
+        counts[job.status] = counts.get(job.status, 0) + 1
+    for status, count in counts.items():
+        jobs_by_status.set(count, status=status)
+
+    stats = renders.stats()
+    render_cache_lookups.set(stats["hits"], result="hit")
+    render_cache_lookups.set(stats["misses"], result="miss")
+    render_cache_lookups.set(stats["in_flight"], result="in_flight")
+
+    for route, stats in db_converter_3.router.metrics().items():
+        for state in ("succeeded", "failed", "queued"):
+            route_files.set(stats[state], route=route, state=state)
+
+
+REGISTRY.add_collector(_collect_app_metrics)
+
+
+def _under_root(path):
+    """The real path of a requested file or folder, or None when it is outside API_ROOT."""
+    if not path:
+        return None
+    real_path = os.path.realpath(os.path.join(API_ROOT, path))
+    if os.path.commonpath([real_path, API_ROOT]) != API_ROOT:
+        return None
+    return real_path
+
 
 @app.route("/")
 def hello():
     return "Hello Matt!"
+
+
+@app.route("/health")
+def health():
+    return jsonify(status="ok", queued_jobs=jobs.queue_depth())
+
+
+@app.route("/metrics")
+def metrics():
+    """Live counters in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queues a rename, convert or json job for a folder and returns its ID."""
+    body = request.get_json(silent=True) or {}
+    folder = _under_root(body.get("folder", ""))
+    if folder is None:
+        return jsonify(error=f"The folder must be inside {API_ROOT}."), 400
+    try:
+        job = jobs.submit(body.get("kind", ""), folder)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except queue.Full:
+        return jsonify(error="The job queue is full, try again shortly."), 503
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.all_jobs()])
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Streams the job's progress as server-sent events."""
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    stream = (format_sse(event) for event in job.stream())
+    return Response(stream, mimetype="text/event-stream")
+
+
+def _send_pdf(pdf_path, key):
+    return send_file(
+        pdf_path,
+        mimetype="application/pdf",
+        etag=key,
+        conditional=True,
+        max_age=RENDER_MAX_AGE,
+    )
+
+
+def _render_failed(name, error=None):
+    """The response for a render that failed or was stopped by a render limit."""
+    if isinstance(error, RenderWorkerDied):
+        # A crashed worker is replaced; the document may well render next time
+        response = jsonify(
+            error=f"The renderer stopped while rendering {name}: {error}"
+        )
+        response.status_code = 503
+        response.headers["Retry-After"] = "10"
+        return response
+    if error is not None:
+        return jsonify(error=f"Could not render {name}: {error}"), 422
+    return jsonify(error=f"Failed to convert {name} to PDF."), 422
+
+
+@app.route("/render", methods=["POST"])
+def render_pdf():
+    """Renders an uploaded HTML file, or one referenced by path, to PDF."""
+    base_url = None
+    if "file" in request.files:
+        upload = request.files["file"]
+        html_bytes = upload.read()
+        name = upload.filename or "upload.html"
+    else:
+        body = request.get_json(silent=True) or request.form
+        path = _under_root(body.get("path", ""))
+        if path is None or not path.endswith(".html") or not os.path.isfile(path):
+            return (
+                jsonify(
+                    error=f"Send an HTML file or the path of one inside {API_ROOT}."
+                ),
+                400,
+            )
+        with open(path, "rb") as html_file:
+            html_bytes = html_file.read()
+        name = path
+        base_url = os.path.dirname(path)
+
+    # Werkzeug only honours If-None-Match on GET, so check it here for POST
+    key = renders.content_hash(html_bytes, base_url)
+    if key in request.if_none_match and renders.cached(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+
+    key, future = renders.render(html_bytes, base_url=base_url, name=name)
+    try:
+        pdf_path = future.result(timeout=RENDER_WAIT_SECONDS)
+    except TimeoutError:
+        response = jsonify(id=key, url=url_for("rendered_pdf", key=key))
+        response.status_code = 202
+        response.headers["Retry-After"] = "10"
+        return response
+    except RENDER_LIMIT_ERRORS as e:
+        return _render_failed(name, e)
+
+    if pdf_path is None:
+        return _render_failed(name)
+    return _send_pdf(pdf_path, key)
+
+
+@app.route("/render/<key>")
+def rendered_pdf(key):
+    """Serves a previously rendered PDF by its content hash."""
+    if not re.fullmatch(r"[0-9a-f]{64}", key):
+        abort(404)
+    pdf_path = renders.cached(key)
+    if pdf_path:
+        return _send_pdf(pdf_path, key)
+    if key in renders.in_flight:
+        return jsonify(id=key, status="rendering"), 202
+    failure = renders.failure(key)
+    if failure is not None:
+        return _render_failed(*failure)
+    abort(404)
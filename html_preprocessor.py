@@ -0,0 +1,265 @@
+import io
+import os
+import re
+import base64
+import logging
+import tempfile
+from html import escape
+from html.parser import HTMLParser
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set PREPROCESS_HTML=1 to clean up HTML before it is rendered
+PREPROCESS_HTML = os.environ.get("PREPROCESS_HTML") == "1"
+# Resolution images are reduced to for the printed page
+TARGET_DPI = int(os.environ.get("PREPROCESS_TARGET_DPI", 150))
+# Usable width of an A4 page with WeasyPrint's default margins
+PAGE_CONTENT_WIDTH_INCHES = 6.3
+# CSS pixels per inch, for converting width attributes
+CSS_PX_PER_INCH = 96
+JPEG_QUALITY = 80
+# Size of each read while streaming a file through the parser
+READ_CHUNK_CHARS = 1024 * 1024
+
+DATA_URI_PATTERN = re.compile(r"^data:(image/[\w.+-]+);base64,(.*)$", re.S)
+# Marked sections HTMLParser closes with "]>" rather than "]]>"
+CONDITIONAL_SECTION = re.compile(r"(if|else|endif)(?![-_.a-zA-Z0-9])", re.I)
+
+
+def _pixels(value):
+    """A width/height attribute as a number of CSS pixels, or None."""
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*(px)?\s*$", value or "")
+    return float(match.group(1)) if match else None
+
+
+def downscale_image(data, display_width_px=None, target_dpi=TARGET_DPI):
+    """Shrinks and recompresses image bytes for print.
+
+    Returns (bytes, mime type), or None if the image is already small enough
+    or could not be made smaller.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        # Recompressing drops EXIF, so bake the orientation into the pixels
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return None
+
+    width_inches = PAGE_CONTENT_WIDTH_INCHES
+    if display_width_px:
+        width_inches = min(width_inches, display_width_px / CSS_PX_PER_INCH)
+    max_width = max(1, int(width_inches * target_dpi))
+
+    if image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    has_alpha = image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if has_alpha:
+        image.save(output, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        image.convert("RGB").save(
+            output, format="JPEG", quality=JPEG_QUALITY, optimize=True
+        )
+        mime_type = "image/jpeg"
+
+    if output.tell() >= len(data):
+        return None
+    return output.getvalue(), mime_type
+
+
+class HTMLPreprocessor(HTMLParser):
+    """Streams HTML through, dropping scripts and tracking pixels and shrinking images.
+
+    Everything else is written back exactly as it came in.
+    """
+
+    def __init__(self, output, base_dir=None, target_dpi=TARGET_DPI):
+        super().__init__(convert_charrefs=False)
+        self.output = output
+        self.base_dir = base_dir
+        self.target_dpi = target_dpi
+        self.in_script = False
+        self.stats = {
+            "scripts_removed": 0,
+            "pixels_removed": 0,
+            "images_downscaled": 0,
+            "image_bytes_saved": 0,
+        }
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script":
+            self.in_script = True
+            self.stats["scripts_removed"] += 1
+            return
+        if tag == "img":
+            self._handle_img(attrs)
+            return
+        self.output.write(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "script":
+            self.stats["scripts_removed"] += 1
+        elif tag == "img":
+            self._handle_img(attrs)
+        else:
+            self.output.write(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self.in_script = False
+            return
+        self.output.write(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self.in_script:
+            self.output.write(data)
+
+    def handle_entityref(self, name):
+        self.output.write(f"&{name};")
+
+    def handle_charref(self, name):
+        self.output.write(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.output.write(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.output.write(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.output.write(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> arrives as "CDATA[..."; <![if !IE]> as "if !IE"
+        close = "]>" if CONDITIONAL_SECTION.match(data) else "]]>"
+        self.output.write(f"<![{data}{close}")
+
+    def _handle_img(self, attrs):
+        values = dict(attrs)
+        width = _pixels(values.get("width"))
+        height = _pixels(values.get("height"))
+        if width is not None and height is not None and width <= 1 and height <= 1:
+            self.stats["pixels_removed"] += 1
+            return
+
+        src = self._downscaled_src(values.get("src") or "", width)
+        if src is None:
+            self.output.write(self.get_starttag_text())
+            return
+
+        rebuilt = []
+        for name, value in attrs:
+            if name == "src":
+                value = src
+            rebuilt.append(name if value is None else f'{name}="{escape(value)}"')
+        self.output.write(f"<img {' '.join(rebuilt)}>")
+
+    def _downscaled_src(self, src, display_width_px):
+        """A data URI for a smaller copy of the image, or None to leave it alone."""
+        match = DATA_URI_PATTERN.match(src)
+        if match:
+            try:
+                data = base64.b64decode(match.group(2))
+            except ValueError:
+                return None
+            original_size = len(src)
+        else:
+            path = self._local_path(src)
+            if path is None:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            original_size = 0
+
+        result = downscale_image(data, display_width_px, self.target_dpi)
+        if result is None:
+            return None
+        image_bytes, mime_type = result
+        new_src = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode()}"
+        if original_size and len(new_src) >= original_size:
+            return None
+
+        self.stats["images_downscaled"] += 1
+        self.stats["image_bytes_saved"] += len(data) - len(image_bytes)
+        return new_src
+
+    def _local_path(self, src):
+        """The file a relative or file:// src points at, if it exists."""
+        parsed = urlparse(src)
+        if parsed.scheme not in ("", "file") or not parsed.path:
+            return None
+        path = unquote(parsed.path)
+        if not os.path.isabs(path):
+            if not self.base_dir:
+                return None
+            path = os.path.join(self.base_dir, path)
+        return path if os.path.isfile(path) else None
+
+
+def preprocess_html_file(html_path, output_path, target_dpi=TARGET_DPI, base_dir=None):
+    """Writes a cleaned-up copy of an HTML file and returns what was changed.
+
+    Relative image paths are looked up in base_dir, which defaults to the
+    file's own folder.
+    """
+    with open(html_path, encoding="utf-8", errors="surrogateescape") as source, open(
+        output_path, "w", encoding="utf-8", errors="surrogateescape"
+    ) as output:
+        preprocessor = HTMLPreprocessor(
+            output,
+            base_dir=base_dir or os.path.dirname(os.path.abspath(html_path)),
+            target_dpi=target_dpi,
+        )
+        while chunk := source.read(READ_CHUNK_CHARS):
+            preprocessor.feed(chunk)
+        preprocessor.close()
+
+    stats = dict(preprocessor.stats)
+    stats["bytes_before"] = os.path.getsize(html_path)
+    stats["bytes_after"] = os.path.getsize(output_path)
+    return stats
+
+
+@contextmanager
+def prepared_html(html_path, enabled=None, base_dir=None):
+    """Yields the file to hand to WeasyPrint: a preprocessed temporary copy or the original.
+
+    Render the yielded file with base_url set to the original's folder so
+    relative links still resolve.
+    """
+    if not (PREPROCESS_HTML if enabled is None else enabled):
+        yield html_path
+        return
+
+    fd, temp_path = tempfile.mkstemp(suffix=".html", prefix="preprocessed_")
+    os.close(fd)
+    try:
+        stats = preprocess_html_file(html_path, temp_path, base_dir=base_dir)
+    except Exception as e:
+        logger.warning(
+            f"Preprocessing failed for {html_path}, rendering as is: {str(e)}"
+        )
+        os.remove(temp_path)
+        yield html_path
+        return
+
+    logger.info(
+        f"Preprocessed {os.path.basename(html_path)}: "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes, "
+        f"{stats['scripts_removed']} scripts, {stats['pixels_removed']} tracking pixels "
+        f"removed, {stats['images_downscaled']} images downscaled"
+    )
+    try:
+        yield temp_path
+    finally:
+        os.remove(temp_path)
@@ -1,9 +1,82 @@
+import os
 import logging
+import threading
 from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
+from html_preprocessor import prepared_html
+from asset_fetcher import get_url_fetcher
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Renders before a renderer drops its fonts and starts afresh
+RENDERER_RECYCLE_EVERY = int(os.environ.get("RENDERER_RECYCLE_EVERY", 500))
+
+# Output size settings handed to write_pdf. Fonts are subset to the glyphs
+# used and streams are compressed, neither of which loses anything. Image
+# changes are lossy and off unless asked for: PDF_OPTIMIZE_IMAGES=1
+# recompresses images, PDF_JPEG_QUALITY re-encodes JPEGs at that quality and
+# PDF_IMAGE_DPI caps image resolution.
+PDF_OUTPUT_OPTIONS = {
+    "optimize_images": os.environ.get("PDF_OPTIMIZE_IMAGES") == "1",
+    "jpeg_quality": int(os.environ.get("PDF_JPEG_QUALITY", 0)) or None,
+    "dpi": int(os.environ.get("PDF_IMAGE_DPI", 0)) or None,
+    "full_fonts": os.environ.get("PDF_FULL_FONTS") == "1",
+    "uncompressed_pdf": False,
+}
+
+
+class PDFRenderer:
+    """Renders HTML to PDF, reusing one FontConfiguration across renders.
+
+    Fonts are looked up and loaded once per renderer rather than once per
+    document; assets come from the shared fetcher cache (see asset_fetcher).
+    Documents are handed to WeasyPrint as they are, so their styles cascade
+    exactly as they would in a plain render.
+    """
+
+    def __init__(self, recycle_every=RENDERER_RECYCLE_EVERY, output_options=None):
+        self.recycle_every = recycle_every
+        self.output_options = dict(PDF_OUTPUT_OPTIONS, **(output_options or {}))
+        self._reset()
+
+    def _reset(self):
+        self.font_config = FontConfiguration()
+        self.renders = 0
+
+    def render(
+        self, filename=None, target=None, string=None, base_url=None, file_root=None
+    ):
+        """Renders a file or string; writes to target, or returns the PDF bytes.
+
+        With file_root set, the document may only load local files inside it.
+        """
+        if self.renders >= self.recycle_every:
+            logger.info(f"Recycling PDF renderer after {self.renders} renders")
+            self._reset()
+        self.renders += 1
+
+        html = HTML(
+            filename,
+            string=string,
+            base_url=base_url,
+            url_fetcher=get_url_fetcher(file_root),
+        )
+        return html.write_pdf(
+            target, font_config=self.font_config, **self.output_options
+        )
+
+
+_renderers = threading.local()
+
+
+def get_renderer():
+    """This thread's renderer; fonts are not shared between threads."""
+    renderer = getattr(_renderers, "renderer", None)
+    if renderer is None:
+        renderer = _renderers.renderer = PDFRenderer()
+    return renderer
+
 
 class html_to_pdf:
     def convert_html_file_to_pdf(filename):
@@ -11,10 +84,32 @@ class html_to_pdf:
         if filename.endswith(".html"):
             pdf_filename = filename.replace(".html", ".pdf")
             try:
-                HTML(filename).write_pdf(pdf_filename)
+                with prepared_html(filename) as source:
+                    get_renderer().render(
+                        source,
+                        pdf_filename,
+                        base_url=os.path.dirname(os.path.abspath(filename)),
+                    )
                 logger.info(f"Successfully converted {filename} to PDF.")
                 return pdf_filename
+            except MemoryError:
+                # Let the render pool know this worker hit its memory limit
+                raise
             except Exception as e:
                 logger.error(f"Failed to convert {filename} to PDF: {str(e)}")
                 return None
         return None
+
+    def convert_html_string_to_pdf(html_string, name="", base_url=None, file_root=None):
+        """Render HTML held in memory, as text or undecoded bytes, and return the PDF as bytes."""
+        try:
+            pdf_bytes = get_renderer().render(
+                string=html_string, base_url=base_url, file_root=file_root
+            )
+            logger.info(f"Successfully converted {name or 'HTML'} to PDF.")
+            return pdf_bytes
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to convert {name or 'HTML'} to PDF: {str(e)}")
+            return None
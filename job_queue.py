@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+import db_converter_3
+from learner_directory import resolve_deferred
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of jobs processed at the same time
+JOB_WORKERS = 4
+# Jobs that can wait for a worker before new submissions are refused
+JOB_QUEUE_SIZE = 20
+# Finished jobs kept around so their status can still be fetched
+MAX_FINISHED_JOBS = 200
+
+
+def _is_json(filename):
+    return filename.endswith(".json")
+
+
+def _is_html(filename):
+    return filename.endswith(".html")
+
+
+def _not_json(filename):
+    return not filename.endswith(".json")
+
+
+# kind -> (which files in the folder it applies to, what to run on each file,
+# where that puts files to retry once the learner directory is back)
+JOB_TYPES = {
+    "rename": (_not_json, db_converter_3.rename_file, db_converter_3.deferred_files),
+    "convert": (_is_html, db_converter_3.convert_html_file, None),
+    "json": (_is_json, db_converter_3.convert_json_file, None),
+}
+
+
+class Job:
+    """One folder submitted for processing, and its progress so far."""
+
+    def __init__(self, kind, folder):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.folder = folder
+        self.status = "queued"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("finished", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "folder": self.folder,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+    def publish(self, **event):
+        """Records a progress event and wakes anyone streaming this job."""
+        with self.changed:
+            event.update(self.to_dict())
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def stream(self, timeout=15):
+        """Yields events as they happen until the job finishes.
+
+        Yields None after `timeout` seconds without news so callers can send
+        a keep-alive.
+        """
+        sent = 0
+        while True:
+            with self.changed:
+                if sent == len(self.events) and not self.finished:
+                    self.changed.wait(timeout)
+                new_events = self.events[sent:]
+                sent = len(self.events)
+                finished = self.finished
+            if not new_events:
+                yield None
+            for event in new_events:
+                yield event
+            if finished and sent == len(self.events):
+                return
+
+
+class JobQueue:
+    """Bounded queue of folder jobs served by a fixed pool of worker threads.
+
+    The workers live as long as the app, so the DB connection, learner name
+    cache and WeasyPrint stay warm from one job to the next.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind, folder):
+        """Queues a job and returns it. Raises queue.Full when the queue is full."""
+        if kind not in JOB_TYPES:
+            raise ValueError(f"Unknown job kind '{kind}'.")
+        if not os.path.isdir(folder):
+            raise ValueError(f"The folder '{folder}' does not exist.")
+
+        job = Job(kind, folder)
+        job.publish(event="queued")
+        with self.lock:
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job.id]
+            raise
+        logger.info(f"Queued {kind} job {job.id} for {folder}")
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def all_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def _handle(job, handler, file_path):
+        try:
+            return bool(handler(file_path))
+        except Exception as e:
+            logger.error(f"Job {job.id}: error processing {file_path}: {e}")
+            return False
+
+    def _run(self, job):
+        applies_to, handler, deferred = JOB_TYPES[job.kind]
+        try:
+            files = [
+                entry.path
+                for entry in os.scandir(job.folder)
+                if entry.is_file() and applies_to(entry.name)
+            ]
+        except OSError as e:
+            job.status = "failed"
+            job.finished_at = time.time()
+            job.publish(event="error", error=str(e))
+            return
+
+        job.total = len(files)
+        job.status = "running"
+        job.publish(event="started")
+
+        for file_path in files:
+            ok = self._handle(job, handler, file_path)
+            job.done += 1
+            if not ok:
+                job.failed += 1
+            job.publish(event="progress", file=os.path.basename(file_path), ok=ok)
+
+        if deferred is not None:
+            # Deferred files were counted as failed; take back the ones that work now
+            def retry(paths):
+                for file_path in paths:
+                    if self._handle(job, handler, file_path):
+                        job.failed -= 1
+                        job.publish(
+                            event="progress", file=os.path.basename(file_path), ok=True
+                        )
+
+            resolve_deferred(deferred, retry, folder=job.folder)
+
+        job.status = "finished"
+        job.finished_at = time.time()
+        job.publish(event="finished")
+        logger.info(f"Finished job {job.id}: {job.done - job.failed}/{job.total} ok")
+
+
+def format_sse(event):
+    """Formats one event for a text/event-stream response."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
@@ -1,24 +1,40 @@
 import json
 import csv
 import os
+import time
 import traceback
-from typing import List, Dict
+from typing import List, Dict, TextIO, Tuple, Union
+from file_catalog import record_output, close_catalog
 
 
 class JSONtoCSVConverter:
-    def json_to_csv(self, data: List[Dict], output_filepath: str) -> str:
+    @staticmethod
+    def clean_csv_filename(filename: str) -> str:
+        """Strips characters that are not safe in a filename and adds the .csv extension."""
+        filename = "".join(
+            c for c in filename if c.isalnum() or c in (" ", ".", "_", "-")
+        ).rstrip()
+        if not filename.endswith(".csv"):
+            filename += ".csv"
+        return filename
+
+    def write_csv(self, data: List[Dict], csv_file: TextIO) -> None:
         if not data:
             raise ValueError("The JSON data is empty.")
 
         fieldnames = list(data[0].keys())
 
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in data:
+            writer.writerow(row)
+
+    def json_to_csv(self, data: List[Dict], output_filepath: str) -> str:
+        if not data:
+            raise ValueError("The JSON data is empty.")
+
         # Ensure the filename is valid
-        output_filename = os.path.basename(output_filepath)
-        output_filename = "".join(
-            c for c in output_filename if c.isalnum() or c in (" ", ".", "_", "-")
-        ).rstrip()
-        if not output_filename.endswith(".csv"):
-            output_filename += ".csv"
+        output_filename = self.clean_csv_filename(os.path.basename(output_filepath))
 
         output_filepath = os.path.join(
             os.path.dirname(output_filepath), output_filename
@@ -26,17 +42,12 @@ class JSONtoCSVConverter:
 
         # Write to CSV file
         with open(output_filepath, "w", newline="") as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in data:
-                writer.writerow(row)
+            self.write_csv(data, csv_file)
 
         return output_filepath
 
-    def process_json_file(self, json_file_path: str) -> None:
-        with open(json_file_path, "r") as json_file:
-            data = json.load(json_file)
-
+    def prepare_data(self, data: Union[List[Dict], Dict]) -> Tuple[List[Dict], str]:
+        """Validates parsed submission JSON and works out the CSV filename for it."""
         if not isinstance(data, list):
             data = [data]
 
@@ -58,10 +69,31 @@ class JSONtoCSVConverter:
             output_filename = f"{data[0]['submitterFirstName']} {data[0]['submitterLastName']} -  {comment_str[0:30]} - {submission_date[:10]} - {file_id[:8]}.csv"
 
         output_filename = output_filename.replace("/", "-")
+        return data, output_filename
 
-        # Use the directory of the input JSON file for the output CSV file
-        output_filepath = os.path.join(os.path.dirname(json_file_path), output_filename)
-        output_file = self.json_to_csv(data, output_filepath)
+    def process_json_file(self, json_file_path: str) -> None:
+        start = time.monotonic()
+        try:
+            with open(json_file_path, "r") as json_file:
+                data = json.load(json_file)
+
+            data, output_filename = self.prepare_data(data)
+
+            # Use the directory of the input JSON file for the output CSV file
+            output_filepath = os.path.join(
+                os.path.dirname(json_file_path), output_filename
+            )
+            output_file = self.json_to_csv(data, output_filepath)
+        except Exception:
+            record_output(json_file_path, None, "csv", tool="json_to_csv")
+            raise
+        record_output(
+            json_file_path,
+            output_file,
+            "csv",
+            time.monotonic() - start,
+            tool="json_to_csv",
+        )
         print(
             f"Conversion complete for {json_file_path}. CSV file saved as '{output_file}'"
         )
@@ -107,3 +139,5 @@ if __name__ == "__main__":
         print(f"An unexpected error occurred: {str(e)}")
         print("Detailed error information:")
         print(traceback.format_exc())
+    finally:
+        close_catalog()
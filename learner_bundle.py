@@ -0,0 +1,121 @@
+import io
+import os
+import re
+import time
+import logging
+from datetime import datetime
+import psutil
+from pypdf import PdfWriter
+from html_preprocessor import prepared_html
+from html_to_pdf import get_renderer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set BUNDLE_PDFS=1 to render each learner's HTML into one PDF instead of one per file
+BUNDLE_PDFS = os.environ.get("BUNDLE_PDFS") == "1"
+# Appended to the learner's name for the bundle's filename
+BUNDLE_SUFFIX = " - submissions.pdf"
+
+# Renamed files look like "<learner> - <identifier> - 2024 01 31 - 09:15:00.html"
+SUBMITTED_AT = re.compile(r" - (\d{4} \d{2} \d{2} - \d{2}:\d{2}:\d{2})")
+
+
+def learner_of(html_path):
+    """The learner a renamed HTML file belongs to, or None if it was never renamed."""
+    filename = os.path.basename(html_path)
+    if not SUBMITTED_AT.search(filename):
+        return None
+    return filename.split(" - ", 1)[0]
+
+
+def submitted_at(html_path):
+    match = SUBMITTED_AT.search(os.path.basename(html_path))
+    if match is None:
+        return datetime.min
+    return datetime.strptime(match.group(1), "%Y %m %d - %H:%M:%S")
+
+
+def bundle_path(directory, learner_name):
+    return os.path.join(directory, f"{learner_name}{BUNDLE_SUFFIX}")
+
+
+def plan_bundles(html_paths):
+    """Groups HTML files into bundles, one per learner and folder.
+
+    Each bundle holds every renamed HTML file the learner has in that folder,
+    not only the ones given, so a bundle rebuilt after new submissions arrive
+    is still complete. Returns ({bundle PDF path: [html paths]}, unbundled
+    paths), with each bundle's files in submission order.
+    """
+    wanted = set()
+    unbundled = []
+    for html_path in html_paths:
+        learner_name = learner_of(html_path)
+        if learner_name is None:
+            unbundled.append(html_path)
+        else:
+            wanted.add((os.path.dirname(html_path), learner_name))
+
+    bundles = {}
+    for directory, learner_name in wanted:
+        prefix = f"{learner_name} - "
+        with os.scandir(directory or ".") as entries:
+            members = [
+                entry.path if directory else entry.name
+                for entry in entries
+                if entry.is_file()
+                and entry.name.startswith(prefix)
+                and entry.name.endswith(".html")
+            ]
+        members.sort(key=lambda path: (submitted_at(path), path))
+        bundles[bundle_path(directory, learner_name)] = members
+    return bundles, unbundled
+
+
+def bookmark_title(html_path):
+    """The bookmark for a submission: its filename without the learner and extension."""
+    filename = os.path.splitext(os.path.basename(html_path))[0]
+    return filename.split(" - ", 1)[-1]
+
+
+def render_bundle(html_paths, pdf_path):
+    """Runs in a render process: returns (bundle PDF path or None, seconds, worker RSS).
+
+    Every document is laid out on its own, as it would be for a single PDF,
+    and the pages are then joined under one bookmark per submission, with the
+    document's own heading bookmarks nested beneath it. Documents that fail to
+    render are left out and logged; the bundle is written once at the end.
+    """
+    start = time.monotonic()
+    writer = PdfWriter()
+    included = 0
+    for html_path in html_paths:
+        base_url = os.path.dirname(os.path.abspath(html_path))
+        try:
+            with prepared_html(html_path) as source:
+                pdf = get_renderer().render(source, base_url=base_url)
+            writer.append(io.BytesIO(pdf), outline_item=bookmark_title(html_path))
+            included += 1
+        except MemoryError:
+            # Let the render pool know this worker hit its memory limit
+            raise
+        except Exception as e:
+            logger.error(f"Left {html_path} out of {pdf_path}: {str(e)}")
+
+    result = None
+    if included:
+        try:
+            tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as pdf_file:
+                writer.write(pdf_file)
+            os.replace(tmp_path, pdf_path)
+            result = pdf_path
+            logger.info(
+                f"Bundled {included} of {len(html_paths)} submissions into {pdf_path}"
+            )
+        except Exception as e:
+            logger.error(f"Failed to write {pdf_path}: {str(e)}")
+    writer.close()
+    rss = psutil.Process(os.getpid()).memory_info().rss
+    return result, time.monotonic() - start, rss
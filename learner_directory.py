@@ -0,0 +1,441 @@
+import os
+import csv
+import time
+import random
+import logging
+import sqlite3
+import threading
+from db_conn import DB_HOST, DB_NAME, DB_USER, DB_PASS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Which backend answers learner name lookups: postgres, sqlite, csv or memory
+LEARNER_DIRECTORY = os.environ.get("LEARNER_DIRECTORY", "postgres")
+# The database file for sqlite, or the apprentice_info export for csv
+LEARNER_DIRECTORY_PATH = os.environ.get("LEARNER_DIRECTORY_PATH", "")
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+SQLITE_BATCH_SIZE = 900
+# Seconds to wait for a new Postgres connection before giving up on it
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+
+# Tries for one lookup before it counts as a failure, with the wait doubling
+# from LOOKUP_BACKOFF seconds between tries
+LOOKUP_ATTEMPTS = 3
+LOOKUP_BACKOFF = 0.5
+# Failed tries in a row, across all lookups, that open the circuit breaker;
+# at LOOKUP_ATTEMPTS it opens as soon as one lookup has used up its tries
+BREAKER_FAILURE_THRESHOLD = LOOKUP_ATTEMPTS
+# Seconds the breaker stays open before one lookup is let through to test the
+# directory; doubles each time that test fails, up to BREAKER_MAX_RESET
+BREAKER_RESET = 15
+BREAKER_MAX_RESET = 300
+# Times deferred files are retried at the end of a run
+DEFERRED_RETRY_PASSES = 3
+
+
+class LearnerDirectoryUnavailable(Exception):
+    """The learner directory cannot be reached; the lookup should be tried again later."""
+
+
+class LearnerDirectory:
+    """Looks up learner names by application UUID."""
+
+    def get_learner_names(self, uuids):
+        """Returns {uuid: name} for every UUID that has a learner."""
+        raise NotImplementedError
+
+    def get_learner_name(self, uuid):
+        return self.get_learner_names([uuid]).get(uuid)
+
+    def close(self):
+        pass
+
+
+class InMemoryLearnerDirectory(LearnerDirectory):
+    """Answers from a dict; useful for tests, benchmarks and small one-off jobs."""
+
+    def __init__(self, names=None):
+        self.names = {uuid.upper(): name for uuid, name in (names or {}).items()}
+
+    def get_learner_names(self, uuids):
+        found = {}
+        for uuid in uuids:
+            name = self.names.get(uuid.upper())
+            if name:
+                found[uuid] = name
+        return found
+
+
+class CSVLearnerDirectory(InMemoryLearnerDirectory):
+    """Loads an apprentice_info export (ApplicationId, learner_full_name) into memory."""
+
+    def __init__(self, path):
+        names = {}
+        with open(path, newline="", encoding="utf-8") as csv_file:
+            for row in csv.DictReader(csv_file):
+                names[row["ApplicationId"]] = row["learner_full_name"]
+        super().__init__(names)
+        logger.info(f"Loaded {len(self.names)} learners from {path}")
+
+
+class SQLiteLearnerDirectory(LearnerDirectory):
+    """Reads a local SQLite copy of the apprentice_info table."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        logger.info(f"Using SQLite learner directory at {path}")
+
+    def get_learner_names(self, uuids):
+        uuids = list(uuids)
+        by_upper = {}
+        for uuid in uuids:
+            by_upper.setdefault(uuid.upper(), []).append(uuid)
+
+        found = {}
+        keys = list(by_upper)
+        with self.lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start : start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    "SELECT ApplicationId, learner_full_name FROM apprentice_info "
+                    f"WHERE ApplicationId IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for application_id, name in rows:
+                    for uuid in by_upper.get(str(application_id).upper(), []):
+                        if name:
+                            found[uuid] = name
+        return found
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresLearnerDirectory(LearnerDirectory):
+    """Queries apprentice_info in Postgres through a thread-safe connection pool."""
+
+    def __init__(
+        self,
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS,
+        minconn=1,
+        maxconn=10,
+    ):
+        import psycopg2
+        from psycopg2 import pool
+
+        self.pool = pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            host=host,
+            database=database,
+            user=user,
+            password=password,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+        )
+        self.connection_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+        logger.info("Database connection pool initialized")
+
+    def _release(self, conn, error):
+        # A connection that lost the server is closed so the pool opens a new one
+        self.pool.putconn(conn, close=isinstance(error, self.connection_errors))
+
+    def get_learner_name(self, uuid):
+        conn = self.pool.getconn()
+        error = None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT learner_full_name FROM apprentice_info WHERE ApplicationId = %s",
+                    (uuid.upper(),),
+                )
+                result = cursor.fetchone()
+                return result[0] if result else None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(conn, error)
+
+    def get_learner_names(self, uuids):
+        uuids = list(uuids)
+        if not uuids:
+            return {}
+
+        conn = self.pool.getconn()
+        error = None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT ApplicationId, learner_full_name FROM apprentice_info "
+                    "WHERE ApplicationId = ANY(%s)",
+                    ([uuid.upper() for uuid in uuids],),
+                )
+                names = {str(row[0]).upper(): row[1] for row in cursor.fetchall()}
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(conn, error)
+
+        return {uuid: names[uuid.upper()] for uuid in uuids if names.get(uuid.upper())}
+
+    def close(self):
+        self.pool.closeall()
+
+
+class CircuitBreakerLearnerDirectory(LearnerDirectory):
+    """Wraps a database-backed directory so an outage fails fast instead of per file.
+
+    The backend is built by connect() on the first lookup rather than up
+    front, so a database that is down when a run starts counts as a failed
+    lookup like any other. Each lookup is tried LOOKUP_ATTEMPTS times with
+    exponential backoff. Every failed try counts: after
+    BREAKER_FAILURE_THRESHOLD in a row the breaker opens and every lookup raises LearnerDirectoryUnavailable
+    straight away. Once the reset time has passed a single lookup is let through: if it
+    works the breaker closes, if not it stays open for twice as long.
+    """
+
+    def __init__(
+        self,
+        connect,
+        attempts=LOOKUP_ATTEMPTS,
+        backoff=LOOKUP_BACKOFF,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_after=BREAKER_RESET,
+        max_reset_after=BREAKER_MAX_RESET,
+    ):
+        # The backend, once connect() has succeeded
+        self.directory = None
+        self.connect = connect
+        self.connect_lock = threading.Lock()
+        self.attempts = attempts
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.max_reset_after = max_reset_after
+
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self.open_for = reset_after
+        self.trial_running = False
+
+    def __getattr__(self, name):
+        # Expose the wrapped backend's attributes, such as its connection pool
+        if name == "directory":
+            raise AttributeError(name)
+        return getattr(self.directory, name)
+
+    def _backend(self):
+        with self.connect_lock:
+            if self.directory is None:
+                self.directory = self.connect()
+            return self.directory
+
+    def _allow(self):
+        """Whether a lookup may go to the backend now; starts the half-open trial."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.open_for:
+                return False
+            self.state = "half-open"
+            self.trial_running = True
+            return True
+
+    def _succeeded(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info("Learner directory is back; closing the circuit breaker")
+            self.state = "closed"
+            self.failures = 0
+            self.open_for = self.reset_after
+            self.trial_running = False
+
+    def _failed(self, error):
+        """Counts a failed try; returns whether the breaker is now open."""
+        with self.lock:
+            self.failures += 1
+            if self.state == "open":
+                # Another lookup opened it while this one was trying
+                return True
+            if self.state == "half-open":
+                self.open_for = min(self.open_for * 2, self.max_reset_after)
+            elif self.failures < self.failure_threshold:
+                return False
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trial_running = False
+            logger.error(
+                f"Learner directory unavailable, failing lookups fast for "
+                f"{self.open_for:.0f}s: {str(error)}"
+            )
+            return True
+
+    def seconds_until_retry(self):
+        """How long until the breaker will let a lookup through; 0 when it would now."""
+        with self.lock:
+            if self.state == "closed":
+                return 0
+            return max(0, self.opened_at + self.open_for - time.monotonic())
+
+    def _call(self, lookup, *args):
+        """Runs the backend's lookup method with retries, connecting first if need be."""
+        if not self._allow():
+            raise LearnerDirectoryUnavailable("Circuit breaker is open")
+
+        delay = self.backoff
+        for attempt in range(1, self.attempts + 1):
+            try:
+                result = getattr(self._backend(), lookup)(*args)
+            except Exception as e:
+                error = e
+                if self._failed(e) or attempt == self.attempts:
+                    break
+                logger.warning(
+                    f"Learner lookup failed (attempt {attempt}), retrying: {str(e)}"
+                )
+                # Jitter keeps parallel workers from retrying in lockstep
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay *= 2
+            else:
+                self._succeeded()
+                return result
+
+        raise LearnerDirectoryUnavailable(str(error)) from error
+
+    def get_learner_names(self, uuids):
+        return self._call("get_learner_names", list(uuids))
+
+    def get_learner_name(self, uuid):
+        return self._call("get_learner_name", uuid)
+
+    def close(self):
+        with self.connect_lock:
+            directory, self.directory = self.directory, None
+        if directory is not None:
+            directory.close()
+
+
+class DeferredFiles:
+    """Files put aside because the learner directory was unavailable when they came up."""
+
+    def __init__(self):
+        # Used as an ordered set
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        with self.lock:
+            self.paths[path] = None
+
+    def drain(self, folder=None):
+        """Takes the deferred paths, or only those directly inside folder."""
+        with self.lock:
+            if folder is None:
+                paths, self.paths = list(self.paths), {}
+                return paths
+            folder = os.path.abspath(folder)
+            paths = [
+                path
+                for path in self.paths
+                if os.path.dirname(os.path.abspath(path)) == folder
+            ]
+            for path in paths:
+                del self.paths[path]
+        return paths
+
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.paths
+
+    def __len__(self):
+        with self.lock:
+            return len(self.paths)
+
+
+def seconds_until_retry():
+    """How long until the learner directory will take a lookup; 0 when it would now."""
+    directory = get_learner_directory()
+    return getattr(directory, "seconds_until_retry", lambda: 0)()
+
+
+def resolve_deferred(deferred, process, passes=DEFERRED_RETRY_PASSES, folder=None):
+    """Runs process(paths) on deferred files again once the directory may be back.
+
+    Waits out an open circuit breaker before each pass. Returns the total
+    process() reported; files still deferred after the last pass are logged
+    and left for the next run. With folder, only the files directly inside
+    it are retried.
+    """
+    total = 0
+    for _ in range(passes):
+        paths = deferred.drain(folder)
+        if not paths:
+            return total
+        wait = seconds_until_retry()
+        logger.info(
+            f"Retrying {len(paths)} files deferred while the learner directory "
+            f"was unavailable" + (f", in {wait:.0f}s" if wait else "")
+        )
+        time.sleep(wait)
+        total += process(paths) or 0
+
+    leftover = deferred.drain(folder)
+    if leftover:
+        logger.warning(
+            f"{len(leftover)} files still have no learner name because the "
+            f"learner directory is unavailable; they were left as they are"
+        )
+    return total
+
+
+def create_learner_directory(backend=None, path=None, **options):
+    """Builds the configured backend; arguments override the environment.
+
+    Database backends are wrapped in a circuit breaker, which connects on
+    the first lookup.
+    """
+    backend = (backend or LEARNER_DIRECTORY).lower()
+    path = path or LEARNER_DIRECTORY_PATH
+
+    if backend == "postgres":
+        return CircuitBreakerLearnerDirectory(
+            lambda: PostgresLearnerDirectory(**options)
+        )
+    if backend == "sqlite":
+        return CircuitBreakerLearnerDirectory(lambda: SQLiteLearnerDirectory(path))
+    if backend == "csv":
+        return CSVLearnerDirectory(path)
+    if backend == "memory":
+        return InMemoryLearnerDirectory(options.get("names"))
+    raise ValueError(f"Unknown learner directory backend '{backend}'.")
+
+
+_default_directory = None
+_default_lock = threading.Lock()
+
+
+def get_learner_directory():
+    """The process-wide learner directory, created on first use."""
+    global _default_directory
+    with _default_lock:
+        if _default_directory is None:
+            _default_directory = create_learner_directory()
+        return _default_directory
+
+
+def close_learner_directory():
+    global _default_directory
+    with _default_lock:
+        if _default_directory is not None:
+            _default_directory.close()
+            _default_directory = None
@@ -0,0 +1,223 @@
+import os
+import math
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import psutil
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Observations kept per summary for computing percentiles
+SUMMARY_WINDOW = 1000
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name
+        + '="'
+        + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    return repr(float(value))
+
+
+class Counter:
+    """A value that only goes up, e.g. files processed."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [
+                (self.name, _format_labels(self.labelnames, key), value)
+                for key, value in self.values.items()
+            ]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, e.g. queue depth."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Summary:
+    """Count, sum and percentiles over the most recent observations."""
+
+    kind = "summary"
+
+    def __init__(self, name, help_text, labelnames=(), window=SUMMARY_WINDOW):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.window = window
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [deque(maxlen=self.window), 0, 0.0]
+            series[0].append(value)
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (observations, count, total) in self.series.items():
+                ordered = sorted(observations)
+                for q in SUMMARY_QUANTILES:
+                    value = (
+                        ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+                        if ordered
+                        else None
+                    )
+                    labels = _format_labels(
+                        self.labelnames, key, [("quantile", str(q))]
+                    )
+                    samples.append((self.name, labels, value))
+                labels = _format_labels(self.labelnames, key)
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, labelnames)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def summary(self, name, help_text, labelnames=()):
+        return self._get_or_create(Summary, name, help_text, labelnames)
+
+    def add_collector(self, collector):
+        """Registers a function that refreshes gauges just before each scrape."""
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in list(self.collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+_rss_bytes = REGISTRY.gauge(
+    "process_resident_memory_bytes", "Resident memory size in bytes."
+)
+
+
+def _collect_process_metrics():
+    _rss_bytes.set(psutil.Process(os.getpid()).memory_info().rss)
+
+
+REGISTRY.add_collector(_collect_process_metrics)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.registry.render().encode("utf-8")
+            content_type = CONTENT_TYPE
+        elif self.path == "/health":
+            body = b"ok\n"
+            content_type = "text/plain"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics and /health from a background thread and returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    )
+    thread.start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
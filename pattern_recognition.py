@@ -1,100 +1,151 @@
 import logging
 import re
-from db_conn import db_conn
+from learner_directory import get_learner_directory, LearnerDirectoryUnavailable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Filename shapes produced by the submissions export, tried in order
+FILENAME_PATTERNS = [
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"(\d{8}T\d{6}-\d{3}Z)\.([\w\s\[\]\-().,'&+–!]+)\.(\w+)$",
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"(\d{8}T\d{6}-\d{3}Z)\.([\w\s\[\]\-().,'&_!]+)\.(.*)$",
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"(\d{8}T\d{5}-\d{3}Z)\.([\w\s\[\]\-().,'&_+!]+)\.([a-zA-Z0-9]+)$",
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"([a-zA-Z0-9]+)\.\d{8}T\d{6}-\d{3}Z(\.[a-zA-Z0-9]+)$",
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+    r"([a-zA-Z0-9]+)\.\d{8}T\d{6}-\d{3}Z\.(.*?)\.(.*)$",
+    r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"(\d{8}T\d{6}-\d{3}Z\.[\w\s\[\]\-().,'&_!]+\.[a-zA-Z0-9]+)$",
+    r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"\d{8}T([0-9]{6}|[7-9][0-9]{4})-\d{3}Z\.[\w\s\[\]\-().,'&_!+]+(\.[a-zA-Z0-9]+)+$",
+    r"^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}\."
+    r"[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}\."
+    r"\d{8}T\d{5}-\d{3}Z\.[\w\s\[\]\-().,'&_+*!]+(\.[a-zA-Z0-9]+)+$",
+    # Corrected pattern with additional group for text between the timestamp and file extension
+    r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
+    r"(\d{8}T\d{5}-\d{3}Z)\.([\w\s\[\]\-().,'&_+!]+)\.([a-zA-Z0-9]+)$",
+]
+
+
 class Pattern_Recog:
+    def __init__(self):
+        # Learner names already fetched this run, keyed by lower-case UUID
+        self.learner_cache = {}
+
     def get_learner_name(self, uuid):
-        """Fetches the learner's full name from the database based on UUID."""
-        conn = db_conn.connect_to_database(self)
-        if conn is None:
-            return None
+        """Fetches the learner's full name from the learner directory based on UUID."""
+        if uuid.lower() in self.learner_cache:
+            return self.learner_cache[uuid.lower()]
 
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT learner_full_name FROM apprentice_info WHERE ApplicationId = %s",
-                    (uuid.upper(),),
-                )
-                result = cursor.fetchone()
-                return result[0] if result else None
+            learner_name = get_learner_directory().get_learner_name(uuid)
+        except LearnerDirectoryUnavailable:
+            # Not the same as no learner: the caller can try the file again later
+            raise
         except Exception as e:
             logger.error(f"Failed to fetch learner name for UUID {uuid}: {str(e)}")
             return None
-        finally:
-            conn.close()
 
-    def remove_unique_identifier(self, filename):
-        """Removes unique identifiers (UUIDs, timestamps, etc.) from filenames and reformats."""
-        logger.info(f"Processing filename: {filename}")
+        self.learner_cache[uuid.lower()] = learner_name
+        return learner_name
+
+    def get_learner_names(self, uuids):
+        """Fetches the names for many UUIDs in one lookup, using the cache where possible.
+
+        Raises LearnerDirectoryUnavailable when the directory cannot be reached,
+        so the caller can hold the whole batch back rather than treat it as
+        having no learners.
+        """
+        wanted = {uuid.lower() for uuid in uuids} - self.learner_cache.keys()
+        if wanted:
+            try:
+                found = get_learner_directory().get_learner_names(wanted)
+                for uuid in wanted:
+                    self.learner_cache[uuid] = found.get(uuid)
+            except LearnerDirectoryUnavailable:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to fetch learner names in bulk: {str(e)}")
+
+        return {
+            uuid: self.learner_cache.get(uuid.lower())
+            for uuid in uuids
+            if self.learner_cache.get(uuid.lower())
+        }
+
+    def parse_filename(self, filename):
+        """Splits an export filename into its UUID, timestamp, description and extension.
 
-        patterns = [
-            r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"(\d{8}T\d{6}-\d{3}Z)\.([\w\s\[\]\-().,'&+–!]+)\.(\w+)$",
-            r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"(\d{8}T\d{6}-\d{3}Z)\.([\w\s\[\]\-().,'&_!]+)\.(.*)$",
-            r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"(\d{8}T\d{5}-\d{3}Z)\.([\w\s\[\]\-().,'&_+!]+)\.([a-zA-Z0-9]+)$",
-            r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"([a-zA-Z0-9]+)\.\d{8}T\d{6}-\d{3}Z(\.[a-zA-Z0-9]+)$",
-            r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
-            r"([a-zA-Z0-9]+)\.\d{8}T\d{6}-\d{3}Z\.(.*?)\.(.*)$",
-            r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"(\d{8}T\d{6}-\d{3}Z\.[\w\s\[\]\-().,'&_!]+\.[a-zA-Z0-9]+)$",
-            r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"\d{8}T([0-9]{6}|[7-9][0-9]{4})-\d{3}Z\.[\w\s\[\]\-().,'&_!+]+(\.[a-zA-Z0-9]+)+$",
-            r"^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}\."
-            r"[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}\."
-            r"\d{8}T\d{5}-\d{3}Z\.[\w\s\[\]\-().,'&_+*!]+(\.[a-zA-Z0-9]+)+$",
-            # Corrected pattern with additional group for text between the timestamp and file extension
-            r"^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})\."
-            r"(\d{8}T\d{5}-\d{3}Z)\.([\w\s\[\]\-().,'&_+!]+)\.([a-zA-Z0-9]+)$",
-        ]
-
-        for pattern in patterns:
+        Returns None if the filename does not match any known pattern.
+        """
+        for pattern in FILENAME_PATTERNS:
             match = re.match(pattern, filename)
             if match:
                 logger.debug(f"Pattern matched: {pattern}")
                 logger.debug(f"Captured Groups: {match.groups()}")
 
-                uuid = match.group(1)
-                time_stamp = match.group(3) if len(match.groups()) > 2 else ""
-                description = match.group(4) if match.lastindex >= 4 else ""
-                file_extension = match.group(match.lastindex)
-                remaining_part = time_stamp.rstrip()
-
-                # Validate UUID length
-                if uuid and len(uuid) == 36:
-                    learner_name = self.get_learner_name(uuid)
-                else:
-                    logger.warning(
-                        "Invalid UUID found in filename. Skipping learner name lookup."
-                    )
-                    learner_name = None
-
-                if learner_name:
-                    if remaining_part:
-                        new_filename = f"{learner_name} - {remaining_part[0:8]} - {description}.{file_extension}"
-                    else:
-                        new_filename = (
-                            f"{learner_name} - {description}.{file_extension}"
-                        )
-
-                    return new_filename.rstrip(), filename.endswith(".html")
-                else:
-                    logger.warning(
-                        f"No learner name found for UUID {uuid}. Using original filename."
-                    )
-                    return filename, filename.endswith(".html")
-
-        logger.info("No patterns matched. No changes made.")
-        return filename, False
+                return {
+                    "uuid": match.group(1),
+                    "time_stamp": match.group(3) if len(match.groups()) > 2 else "",
+                    "description": match.group(4) if match.lastindex >= 4 else "",
+                    "file_extension": match.group(match.lastindex),
+                }
+        return None
+
+    @staticmethod
+    def has_valid_uuid(parsed):
+        """True if the parsed filename carries a full 36 character UUID."""
+        return bool(parsed["uuid"]) and len(parsed["uuid"]) == 36
+
+    @staticmethod
+    def format_filename(parsed, learner_name):
+        """Builds the readable filename for a parsed export filename."""
+        remaining_part = parsed["time_stamp"].rstrip()
+        description = parsed["description"]
+        file_extension = parsed["file_extension"]
+
+        if remaining_part:
+            new_filename = f"{learner_name} - {remaining_part[0:8]} - {description}.{file_extension}"
+        else:
+            new_filename = f"{learner_name} - {description}.{file_extension}"
+        return new_filename.rstrip()
+
+    def remove_unique_identifier(self, filename):
+        """Removes unique identifiers (UUIDs, timestamps, etc.) from filenames and reformats."""
+        logger.info(f"Processing filename: {filename}")
+
+        parsed = self.parse_filename(filename)
+        if parsed is None:
+            logger.info("No patterns matched. No changes made.")
+            return filename, False
+
+        uuid = parsed["uuid"]
+
+        # Validate UUID length
+        if self.has_valid_uuid(parsed):
+            learner_name = self.get_learner_name(uuid)
+        else:
+            logger.warning(
+                "Invalid UUID found in filename. Skipping learner name lookup."
+            )
+            learner_name = None
+
+        if learner_name:
+            return self.format_filename(parsed, learner_name), filename.endswith(
+                ".html"
+            )
+        else:
+            logger.warning(
+                f"No learner name found for UUID {uuid}. Using original filename."
+            )
+            return filename, filename.endswith(".html")
@@ -0,0 +1,163 @@
+import os
+import time
+import logging
+import threading
+import psutil
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bounds for the number of PDFs rendered at the same time
+MIN_RENDER_WORKERS = 1
+MAX_RENDER_WORKERS = os.cpu_count() or 1
+# Memory kept free for everything else on the box; renders are shed below this
+MEMORY_RESERVE_MB = int(os.environ.get("RENDER_MEMORY_RESERVE_MB", 1024))
+# Stop adding renders once CPU utilisation is above this
+TARGET_CPU_PERCENT = 90
+# Seconds between concurrency decisions
+CONTROL_INTERVAL = 2
+# Starting guess for one render worker's RSS until renders have been observed
+INITIAL_RENDER_RSS_MB = 300
+
+# "largest" renders the most expensive documents first, which gives the
+# shortest total run; "smallest" gets the first PDFs out sooner
+RENDER_ORDER = os.environ.get("RENDER_ORDER", "largest")
+# Extra cost, in bytes of HTML, charged for each image and table in a document
+IMAGE_COST_BYTES = 200_000
+TABLE_COST_BYTES = 50_000
+# Read size for the pre-scan that counts images and tables
+SCAN_CHUNK_BYTES = 1024 * 1024
+
+
+def estimate_render_cost(html_path):
+    """A rough render cost for an HTML file from its size and image/table counts.
+
+    Reads the file once as raw bytes and counts tags without parsing, so the
+    estimate costs a small fraction of the render itself.
+    """
+    images = tables = 0
+    tail = b""
+    try:
+        size = os.path.getsize(html_path)
+        with open(html_path, "rb") as f:
+            while chunk := f.read(SCAN_CHUNK_BYTES):
+                # Keep the end of the last chunk so tags split across reads count
+                text = tail + chunk.lower()
+                images += text.count(b"<img")
+                tables += text.count(b"<table")
+                tail = text[-5:]
+                images -= tail.count(b"<img")
+                tables -= tail.count(b"<table")
+        images += tail.count(b"<img")
+        tables += tail.count(b"<table")
+    except OSError as e:
+        logger.warning(f"Could not estimate render cost for {html_path}: {str(e)}")
+        return 0
+    return size + images * IMAGE_COST_BYTES + tables * TABLE_COST_BYTES
+
+
+def order_by_cost(html_paths, order=RENDER_ORDER):
+    """Sorts HTML files for rendering by their estimated cost."""
+    if order not in ("largest", "smallest"):
+        raise ValueError(f"Unknown render order '{order}'.")
+    costs = {html_path: estimate_render_cost(html_path) for html_path in html_paths}
+    return sorted(html_paths, key=costs.get, reverse=order == "largest")
+
+
+class RenderConcurrencyController:
+    """Decides how many PDF renders may run at once from CPU, free memory and render RSS.
+
+    Callers take a slot with acquire() before starting a render and give it
+    back with release(). Every CONTROL_INTERVAL the limit is revisited: it
+    drops as soon as free memory falls below the reserve or the box starts
+    swapping, and climbs one step at a time while there is CPU and memory
+    for another render.
+    """
+
+    def __init__(
+        self,
+        min_workers=MIN_RENDER_WORKERS,
+        max_workers=MAX_RENDER_WORKERS,
+        memory_reserve_mb=MEMORY_RESERVE_MB,
+        target_cpu_percent=TARGET_CPU_PERCENT,
+        interval=CONTROL_INTERVAL,
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.memory_reserve = memory_reserve_mb * 1024 * 1024
+        self.target_cpu_percent = target_cpu_percent
+        self.interval = interval
+
+        self.limit = min_workers
+        self.active = 0
+        self.render_rss = INITIAL_RENDER_RSS_MB * 1024 * 1024
+        self.condition = threading.Condition()
+        self.last_update = 0
+        self.last_swap_out = psutil.swap_memory().sout
+        # Primes cpu_percent so the first reading covers a real interval
+        psutil.cpu_percent(interval=None)
+
+    def observe_render_rss(self, rss_bytes):
+        """Records the RSS of a worker that has just rendered a PDF."""
+        with self.condition:
+            # Track the heaviest recent render, decaying slowly so one huge
+            # document does not hold concurrency down for the rest of the run
+            self.render_rss = max(rss_bytes, int(self.render_rss * 0.95))
+
+    def acquire(self):
+        """Blocks until another render may start."""
+        with self.condition:
+            while True:
+                if time.monotonic() - self.last_update >= self.interval:
+                    self._update()
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                self.condition.wait(self.interval)
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def _update(self):
+        self.last_update = time.monotonic()
+        memory = psutil.virtual_memory()
+        cpu = psutil.cpu_percent(interval=None)
+        swap_out = psutil.swap_memory().sout
+        swapping = swap_out > self.last_swap_out
+        self.last_swap_out = swap_out
+
+        headroom = memory.available - self.memory_reserve
+        if headroom < 0 or swapping:
+            # Shed by as many renders as it takes to get back above the reserve
+            shed = max(1, -headroom // self.render_rss + 1) if headroom < 0 else 1
+            new_limit = max(self.min_workers, self.limit - shed)
+            reason = "swapping" if swapping else "low memory"
+        elif (
+            headroom >= self.render_rss
+            and cpu < self.target_cpu_percent
+            and self.active >= self.limit
+        ):
+            new_limit = min(self.max_workers, self.limit + 1)
+            reason = "headroom"
+        else:
+            new_limit = self.limit
+            reason = ""
+
+        if new_limit != self.limit:
+            logger.info(
+                f"PDF render concurrency {self.limit} -> {new_limit} ({reason}): "
+                f"cpu {cpu:.0f}%, available {memory.available / 1024 / 1024:.0f} MB, "
+                f"render RSS {self.render_rss / 1024 / 1024:.0f} MB"
+            )
+            self.limit = new_limit
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "render_rss_mb": round(self.render_rss / 1024 / 1024, 1),
+            }
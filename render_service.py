@@ -0,0 +1,142 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from html_to_pdf import html_to_pdf
+from render_workers import render_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where rendered PDFs are kept, named by the hash of their source
+RENDER_CACHE_DIR = os.environ.get(
+    "RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_render_cache")
+)
+# Number of WeasyPrint processes rendering at the same time
+RENDER_WORKERS = 2
+# Failed renders remembered so a client polling for the PDF hears why
+MAX_REMEMBERED_FAILURES = 500
+
+
+def _render_to_file(html_bytes, base_url, name, pdf_path, file_root=None):
+    """Runs in a worker process: renders the HTML and writes the PDF atomically.
+
+    The bytes go to WeasyPrint as they are, so it picks the encoding from the
+    document's <meta charset> or BOM.
+    """
+    pdf_bytes = html_to_pdf.convert_html_string_to_pdf(
+        html_bytes, name=name, base_url=base_url, file_root=file_root
+    )
+    if pdf_bytes is None:
+        return None
+
+    tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as pdf_file:
+        pdf_file.write(pdf_bytes)
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
+
+
+class PDFRenderCache:
+    """Renders HTML to PDF on a process pool and caches the result by content hash.
+
+    The same document is only ever rendered once: repeat requests are served
+    from the cache and concurrent requests share a single render. With
+    file_root set, documents may only load local files inside that directory.
+    """
+
+    def __init__(
+        self, cache_dir=RENDER_CACHE_DIR, workers=RENDER_WORKERS, file_root=None
+    ):
+        self.cache_dir = cache_dir
+        self.file_root = file_root
+        os.makedirs(cache_dir, exist_ok=True)
+        self.executor = render_pool(workers)
+        self.in_flight = {}
+        # key -> (name, exception or None) for the latest failed renders
+        self.failures = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(html_bytes, base_url=None):
+        """The cache key and ETag for a document."""
+        digest = hashlib.sha256(html_bytes)
+        if base_url:
+            # Relative assets resolve differently from different folders
+            digest.update(b"\0" + base_url.encode("utf-8"))
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def cached(self, key):
+        """Returns the cached PDF path for a key, or None."""
+        pdf_path = self.path_for(key)
+        return pdf_path if os.path.exists(pdf_path) else None
+
+    def render(self, html_bytes, base_url=None, name=""):
+        """Returns (key, future) for the document; the future yields the PDF path."""
+        key = self.content_hash(html_bytes, base_url)
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.hits += 1
+                return key, future
+
+            if self.cached(key):
+                self.hits += 1
+                future = self._done_future(self.path_for(key))
+                return key, future
+
+            self.misses += 1
+            self.failures.pop(key, None)
+            future = self.executor.submit(
+                _render_to_file,
+                html_bytes,
+                base_url,
+                name,
+                self.path_for(key),
+                self.file_root,
+            )
+            self.in_flight[key] = future
+
+        future.add_done_callback(lambda future: self._finished(key, name, future))
+        return key, future
+
+    def _finished(self, key, name, future):
+        error = None if future.cancelled() else future.exception()
+        failed = future.cancelled() or error is not None or future.result() is None
+        with self.lock:
+            self.in_flight.pop(key, None)
+            if failed:
+                self.failures[key] = (name, error)
+                while len(self.failures) > MAX_REMEMBERED_FAILURES:
+                    self.failures.popitem(last=False)
+
+    def failure(self, key):
+        """(name, exception or None) if the last render of this key failed, else None."""
+        with self.lock:
+            return self.failures.get(key)
+
+    @staticmethod
+    def _done_future(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "in_flight": len(self.in_flight),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
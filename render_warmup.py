@@ -0,0 +1,31 @@
+"""Imported once by the render fork server (see render_workers).
+
+Importing WeasyPrint and rendering a tiny document loads pango, cairo and the
+system font cache, and every worker forked afterwards inherits them
+copy-on-write.
+"""
+
+import time
+import logging
+from html_to_pdf import get_renderer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Touches the common font families and weights so their fonts are loaded
+WARMUP_HTML = (
+    "<html><body>"
+    "<p style='font-family: sans-serif'>Warm up <b>bold</b> <i>italic</i></p>"
+    "<p style='font-family: serif'>Warm up <b>bold</b> <i>italic</i></p>"
+    "<p style='font-family: monospace'>Warm up</p>"
+    "<table><tr><td>1</td><td>2</td></tr></table>"
+    "</body></html>"
+)
+
+start = time.monotonic()
+try:
+    get_renderer().render(string=WARMUP_HTML)
+    logger.info(f"Render workers warmed up in {time.monotonic() - start:.2f}s")
+except Exception as e:
+    # A failed warm-up must not take the fork server down with it
+    logger.warning(f"Render warm-up failed: {str(e)}")
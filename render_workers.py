@@ -0,0 +1,349 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+from multiprocessing import forkserver
+from concurrent.futures import Executor, Future
+from heap_profiler import stop_profiler
+from file_catalog import user_data_dir
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Renders a worker handles before it is replaced by a fresh fork, which caps
+# how far any one worker's memory can creep up. Off by default; the renderer
+# already recycles its own fonts regularly.
+RENDER_WORKER_MAX_TASKS = int(os.environ.get("RENDER_WORKER_MAX_TASKS", 0))
+# Seconds one render may run before its worker is killed; 0 for no limit
+RENDER_TIMEOUT = float(os.environ.get("RENDER_TIMEOUT", 300))
+# Address space a render worker may use, in MB, enforced with RLIMIT_AS;
+# 0 for no limit
+RENDER_MEMORY_LIMIT_MB = int(os.environ.get("RENDER_MEMORY_LIMIT_MB", 4096))
+# HTML files whose render was stopped by the time or memory limit are listed
+# here for a later retry pass (snapshot_converter option 4); "" for no list
+RENDER_RETRY_LIST = os.environ.get(
+    "RENDER_RETRY_LIST", os.path.join(user_data_dir(), "render_retry.txt")
+)
+# Workers shared by renders that happen one file at a time, outside render_pdfs
+SHARED_RENDER_WORKERS = int(os.environ.get("SHARED_RENDER_WORKERS", 2))
+# Seconds a worker gets to exit cleanly before it is killed
+WORKER_EXIT_GRACE = 5
+# Imported once by the fork server, before any worker is forked from it
+PRELOAD_MODULES = ["render_warmup"]
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def warm_context():
+    """A forkserver context that preloads WeasyPrint, or None where there is no forkserver."""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    # The fork server is a fresh interpreter that ignores our sys.path, so it
+    # only finds the preload modules through PYTHONPATH
+    paths = [
+        path for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+    ]
+    if MODULE_DIR not in paths:
+        os.environ["PYTHONPATH"] = os.pathsep.join([MODULE_DIR] + paths)
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD_MODULES)
+    return context
+
+
+class RenderTimeout(Exception):
+    """A render ran past the time limit and its worker was killed."""
+
+
+class RenderMemoryExceeded(Exception):
+    """A render ran out of memory under the worker's memory limit."""
+
+
+class RenderWorkerDied(Exception):
+    """A worker exited in the middle of a render, e.g. a crash in native code."""
+
+
+# Raised for renders that were stopped by a limit rather than failing on their own
+RENDER_LIMIT_ERRORS = (RenderTimeout, RenderMemoryExceeded, RenderWorkerDied)
+
+
+def _worker_main(conn, memory_limit_mb):
+    """Runs in a worker process: runs (fn, args, kwargs) tasks from conn until told to stop."""
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            # e.g. a hard limit below ours that only a privileged process may raise
+            logger.warning(
+                f"Render worker {os.getpid()} has no {memory_limit_mb} MB memory "
+                f"limit: {str(e)}"
+            )
+
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+
+            fn, args, kwargs = task
+            try:
+                result = fn(*args, **kwargs)
+            except MemoryError:
+                conn.send(
+                    (False, RenderMemoryExceeded(f"Went over {memory_limit_mb} MB"))
+                )
+                # The heap may be in a bad way after this; start afresh
+                return
+            except Exception as e:
+                try:
+                    conn.send((False, e))
+                except Exception:
+                    conn.send((False, RuntimeError(repr(e))))
+            else:
+                conn.send((True, result))
+    finally:
+        # With PROFILE_MEMORY on, save this worker's heap profile for the parent
+        try:
+            stop_profiler()
+        except Exception as e:
+            logger.warning(f"Render worker {os.getpid()} lost its heap profile: {e}")
+
+
+def list_for_retry(html_paths, retry_list=RENDER_RETRY_LIST):
+    """Appends files whose render went over a limit to the retry list, if there is one."""
+    if not retry_list:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(retry_list)), exist_ok=True)
+    with open(retry_list, "a", encoding="utf-8") as f:
+        f.write("".join(os.path.abspath(path) + "\n" for path in sorted(html_paths)))
+
+
+class SupervisedPool(Executor):
+    """A process pool in which any single task can be killed without losing the pool.
+
+    Each of max_workers supervisor threads owns one worker process and hands
+    it one task at a time. A task that runs past the timeout gets its worker
+    killed and a RenderTimeout; a worker that runs out of memory under its
+    limit, or crashes, is replaced. Either way the supervisor forks a fresh
+    worker and moves on to the next task, so the other workers keep going.
+    """
+
+    def __init__(
+        self,
+        max_workers,
+        mp_context=None,
+        timeout=RENDER_TIMEOUT,
+        memory_limit_mb=RENDER_MEMORY_LIMIT_MB,
+        max_tasks_per_child=None,
+    ):
+        self.context = mp_context or multiprocessing.get_context()
+        self.timeout = timeout or None
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.tasks = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.shutting_down = False
+        self.killed = 0
+        self.pid = os.getpid()
+        self.supervisors = [
+            threading.Thread(
+                target=self._supervise, name=f"render-supervisor-{i}", daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for supervisor in self.supervisors:
+            supervisor.start()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self.tasks.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self.lock:
+            if not self.shutting_down:
+                self.shutting_down = True
+                if cancel_futures:
+                    while True:
+                        try:
+                            task = self.tasks.get_nowait()
+                        except queue.Empty:
+                            break
+                        task[0].cancel()
+                for _ in self.supervisors:
+                    self.tasks.put(None)
+        if wait:
+            for supervisor in self.supervisors:
+                supervisor.join()
+
+    def _start_worker(self):
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_limit_mb),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    @staticmethod
+    def _stop_worker(process, conn, kill=False):
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        process.join(WORKER_EXIT_GRACE)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _run(self, process, conn, fn, args, kwargs):
+        """Runs one task on the worker; returns (ok, result or exception, worker usable)."""
+        try:
+            conn.send((fn, args, kwargs))
+            if not conn.poll(self.timeout):
+                self.killed += 1
+                logger.warning(
+                    f"Killing render worker {process.pid}: still running after "
+                    f"{self.timeout:.0f}s"
+                )
+                return (
+                    False,
+                    RenderTimeout(f"Did not finish within {self.timeout:.0f}s"),
+                    False,
+                )
+            ok, value = conn.recv()
+        except (EOFError, OSError):
+            process.join(WORKER_EXIT_GRACE)
+            return (
+                False,
+                RenderWorkerDied(
+                    f"Worker {process.pid} died with exit code {process.exitcode}"
+                ),
+                False,
+            )
+        usable = not isinstance(value, RenderMemoryExceeded)
+        return ok, value, usable
+
+    def _supervise(self):
+        worker = None
+        tasks_done = 0
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            future, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if worker is None:
+                    worker = self._start_worker()
+                    tasks_done = 0
+                ok, value, usable = self._run(*worker, fn, args, kwargs)
+            except Exception as e:
+                # Could not start a worker or send it the task
+                ok, value, usable = False, e, worker is not None
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+            tasks_done += 1
+            if worker is not None and (
+                not usable or tasks_done == self.max_tasks_per_child
+            ):
+                # A worker out of memory exits by itself once it has saved
+                # its heap profile; one that timed out or died is killed
+                out_of_memory = isinstance(value, RenderMemoryExceeded)
+                self._stop_worker(*worker, kill=not usable and not out_of_memory)
+                worker = None
+
+        if worker is not None:
+            self._stop_worker(*worker)
+
+
+def start_render_server():
+    """Starts the warm fork server in the background, ahead of the first render.
+
+    Call this before other slow work (such as renaming a folder) so the
+    warm-up overlaps with it.
+    """
+    if warm_context() is not None:
+        forkserver.ensure_running()
+
+
+def render_pool(
+    max_workers,
+    max_tasks_per_child=RENDER_WORKER_MAX_TASKS,
+    timeout=RENDER_TIMEOUT,
+    memory_limit_mb=RENDER_MEMORY_LIMIT_MB,
+):
+    """A supervised process pool for PDF renders whose workers fork from a warm server.
+
+    The fork server imports WeasyPrint and renders a small document once, so
+    each worker, including any replacement after a kill or after
+    max_tasks_per_child renders, starts with pango, cairo and the font cache
+    already loaded. Falls back to the default start method on platforms
+    without forkserver.
+    """
+    return SupervisedPool(
+        max_workers,
+        mp_context=warm_context(),
+        timeout=timeout,
+        memory_limit_mb=memory_limit_mb,
+        max_tasks_per_child=max_tasks_per_child or None,
+    )
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def shutdown_shared_pool():
+    """Stops the workers render_isolated started in this process, if any."""
+    global _shared_pool
+    with _shared_lock:
+        pool = _shared_pool
+        if pool is None or pool.pid != os.getpid():
+            return
+        _shared_pool = None
+    pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_shared_pool)
+
+
+def render_isolated(fn, /, *args, **kwargs):
+    """Runs one render in this process's shared supervised pool and returns its result.
+
+    For code that renders a file at a time, such as a rename that converts
+    as it goes, so the render gets the same time and memory limits as the
+    ones in render_pdfs. Raises one of RENDER_LIMIT_ERRORS when a limit
+    stopped the render.
+    """
+    global _shared_pool
+    with _shared_lock:
+        # A pool started before a fork belongs to the parent
+        if _shared_pool is None or _shared_pool.pid != os.getpid():
+            _shared_pool = render_pool(SHARED_RENDER_WORKERS)
+        pool = _shared_pool
+    return pool.submit(fn, *args, **kwargs).result()
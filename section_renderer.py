@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import logging
+from html.parser import HTMLParser
+import psutil
+from pypdf import PdfWriter
+from html_preprocessor import prepared_html
+from html_to_pdf import get_renderer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set SPLIT_LARGE_HTML=1 to render large documents in sections
+SPLIT_LARGE_HTML = os.environ.get("SPLIT_LARGE_HTML") == "1"
+# Documents at least this big are split
+SPLIT_THRESHOLD_BYTES = 5 * 1024 * 1024
+# Roughly how much of the body goes into each section
+SECTION_TARGET_BYTES = 1024 * 1024
+
+# Elements that never have an end tag
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+class _BodyChildFinder(HTMLParser):
+    """Records where each top-level child of <body> starts.
+
+    Only counts nesting depth, so a document that leans on optional end tags
+    (an unclosed <p> or <li>) ends <body> at a non-zero depth and is marked
+    broken rather than split in the wrong place.
+    """
+
+    def __init__(self, line_offsets):
+        super().__init__(convert_charrefs=True)
+        self.line_offsets = line_offsets
+        self.depth = None
+        self.body_start = None
+        self.body_end = None
+        self.boundaries = []
+        self.broken = False
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def _in_body(self):
+        return self.depth is not None and self.body_end is None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.depth = 0
+            self.body_start = self._offset() + len(self.get_starttag_text())
+            return
+        if not self._in_body():
+            return
+        if self.depth == 0:
+            self.boundaries.append(self._offset())
+        if tag not in VOID_ELEMENTS:
+            self.depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._in_body() and self.depth == 0:
+            self.boundaries.append(self._offset())
+
+    def handle_endtag(self, tag):
+        if tag == "body" and self._in_body():
+            self.body_end = self._offset()
+            self.broken = self.broken or self.depth != 0
+            return
+        if not self._in_body() or tag in VOID_ELEMENTS:
+            return
+        self.depth -= 1
+        if self.depth < 0:
+            self.broken = True
+            self.depth = 0
+
+
+def split_html(html_text, target_bytes=SECTION_TARGET_BYTES):
+    """Splits a document between top-level <body> children into standalone sections.
+
+    Every section keeps the original <head>, so styles and fonts are the same
+    in each one. Each section starts on a new page and page counters restart,
+    so only split documents where that does not matter. Returns [] if the
+    document cannot be split safely or would only make one section.
+    """
+    line_offsets = [0] + [match.end() for match in re.finditer("\n", html_text)]
+    finder = _BodyChildFinder(line_offsets)
+    finder.feed(html_text)
+    finder.close()
+
+    if finder.body_start is None or finder.broken or finder.depth not in (0, None):
+        return []
+    body_end = finder.body_end if finder.body_end is not None else len(html_text)
+
+    head = html_text[: finder.body_start]
+    starts = [finder.body_start] + finder.boundaries[1:] + [body_end]
+    sections = []
+    section_start = starts[0]
+    for boundary in starts[1:]:
+        if boundary - section_start >= target_bytes or boundary == body_end:
+            sections.append(head + html_text[section_start:boundary] + "</body></html>")
+            section_start = boundary
+    return sections if len(sections) > 1 else []
+
+
+def split_html_file(html_path, section_dir, threshold=SPLIT_THRESHOLD_BYTES):
+    """Writes the sections of a large HTML file to section_dir and returns their paths.
+
+    Returns [] for files under the threshold or that cannot be split.
+    """
+    try:
+        if os.path.getsize(html_path) < threshold:
+            return []
+        with open(html_path, encoding="utf-8") as f:
+            sections = split_html(f.read())
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Not splitting {html_path}: {str(e)}")
+        return []
+
+    base = os.path.join(section_dir, os.path.basename(html_path))
+    section_paths = []
+    for index, section in enumerate(sections):
+        section_path = f"{base}.{index:04d}.html"
+        with open(section_path, "w", encoding="utf-8") as f:
+            f.write(section)
+        section_paths.append(section_path)
+
+    if section_paths:
+        logger.info(f"Split {html_path} into {len(section_paths)} sections")
+    return section_paths
+
+
+def render_section(section_path, base_url):
+    """Runs in a render process: returns (section PDF path or None, seconds, worker RSS)."""
+    pdf_path = section_path[: -len(".html")] + ".pdf"
+    start = time.monotonic()
+    try:
+        with prepared_html(section_path, base_dir=base_url) as source:
+            get_renderer().render(source, pdf_path, base_url=base_url)
+    except MemoryError:
+        # Let the render pool know this worker hit its memory limit
+        raise
+    except Exception as e:
+        logger.error(f"Failed to convert section {section_path} to PDF: {str(e)}")
+        pdf_path = None
+    rss = psutil.Process(os.getpid()).memory_info().rss
+    return pdf_path, time.monotonic() - start, rss
+
+
+def merge_pdfs(section_pdfs, pdf_path):
+    """Concatenates section PDFs, in order, into pdf_path."""
+    writer = PdfWriter()
+    for section_pdf in section_pdfs:
+        writer.append(section_pdf)
+
+    tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as pdf_file:
+        writer.write(pdf_file)
+    writer.close()
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import socket
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Export files start with the learner's application UUID
+LEARNER_UUID_PATTERN = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\."
+)
+# Manifest lines are flushed to disk after this many files
+MANIFEST_FLUSH_EVERY = 20
+MANIFEST_DIRNAME = ".shard_manifest"
+MERGED_MANIFEST = "manifest.jsonl"
+SHARD_MANIFEST_PATTERN = re.compile(r"^shard-(\d+)-of-(\d+)\.jsonl$")
+
+
+def shard_for(uuid, shard_count):
+    """The shard a learner belongs to; the same on every host and Python version."""
+    digest = hashlib.md5(uuid.lower().encode("ascii")).hexdigest()
+    return int(digest, 16) % shard_count
+
+
+def shard_manifest_path(manifest_dir, shard, shard_count):
+    return os.path.join(manifest_dir, f"shard-{shard:04d}-of-{shard_count:04d}.jsonl")
+
+
+def files_for_shard(folder, shard, shard_count):
+    """Original export files in the folder whose learner UUID hashes to this shard.
+
+    Files that do not start with a UUID (including other shards' renamed
+    outputs) are never picked up.
+    """
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            match = LEARNER_UUID_PATTERN.match(entry.name)
+            if match and shard_for(match.group(1), shard_count) == shard:
+                files.append(entry.path)
+    return sorted(files)
+
+
+def read_manifest(path):
+    """Returns the records in a manifest file, skipping a torn last line."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring incomplete manifest line in {path}")
+    return records
+
+
+def run_shard(folder, shard, shard_count, manifest_dir):
+    """Processes one shard of the folder, appending each result to its own manifest.
+
+    Only this process writes this shard's manifest, so no locking is needed
+    between workers. Files already in the manifest are skipped, so a shard can
+    be rerun after a crash. Files deferred because the learner directory was
+    unavailable are retried at the end of the shard; any still deferred are
+    left out of the manifest so the next run picks them up.
+    """
+    import snapshot_converter
+    from learner_directory import resolve_deferred
+
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest_path = shard_manifest_path(manifest_dir, shard, shard_count)
+    done = {record["file"] for record in read_manifest(manifest_path)}
+    files = [
+        path
+        for path in files_for_shard(folder, shard, shard_count)
+        if os.path.basename(path) not in done
+    ]
+    logger.info(
+        f"Shard {shard}/{shard_count}: {len(files)} files to process, "
+        f"{len(done)} already done"
+    )
+
+    host = socket.gethostname()
+    deferred = snapshot_converter.deferred_files
+    written = 0
+    snapshot_converter.init_connection_pool()
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest:
+
+            def process(paths):
+                nonlocal written
+                renamed_count = 0
+                for file_path in paths:
+                    start = time.monotonic()
+                    renamed = snapshot_converter.rename_file(file_path)
+                    renamed_count += bool(renamed)
+                    if file_path in deferred:
+                        continue
+                    record = {
+                        "file": os.path.basename(file_path),
+                        "shard": shard,
+                        "renamed": bool(renamed),
+                        "seconds": round(time.monotonic() - start, 3),
+                        "host": host,
+                        "pid": os.getpid(),
+                        "finished_at": datetime.now(timezone.utc).isoformat(),
+                    }
+                    manifest.write(json.dumps(record) + "\n")
+                    written += 1
+                    if written % MANIFEST_FLUSH_EVERY == 0:
+                        manifest.flush()
+                        os.fsync(manifest.fileno())
+                return renamed_count
+
+            renamed_count = process(files)
+            renamed_count += resolve_deferred(deferred, process)
+    finally:
+        snapshot_converter.close_connection_pool()
+
+    logger.info(f"Shard {shard}/{shard_count}: renamed {renamed_count} files")
+    return shard, len(files), renamed_count
+
+
+def run_shards(folder, shards, shard_count, manifest_dir, processes=None):
+    """Runs the given shards on this host, one process per shard at a time."""
+    results = {}
+    with ProcessPoolExecutor(max_workers=processes or len(shards)) as executor:
+        futures = [
+            executor.submit(run_shard, folder, shard, shard_count, manifest_dir)
+            for shard in shards
+        ]
+        for future in as_completed(futures):
+            try:
+                shard, processed, renamed = future.result()
+                results[shard] = (processed, renamed)
+            except Exception as e:
+                logger.error(f"Shard failed: {str(e)}")
+    return results
+
+
+def merge_manifests(manifest_dir):
+    """Combines every shard manifest into one, reporting shards that are missing.
+
+    Returns a summary dict. The merged manifest is written atomically next to
+    the shard files.
+    """
+    shard_counts = set()
+    seen_shards = set()
+    records = {}
+
+    for name in sorted(os.listdir(manifest_dir)):
+        match = SHARD_MANIFEST_PATTERN.match(name)
+        if not match:
+            continue
+        shard, shard_count = int(match.group(1)), int(match.group(2))
+        shard_counts.add(shard_count)
+        seen_shards.add(shard)
+        for record in read_manifest(os.path.join(manifest_dir, name)):
+            # A rerun shard may repeat a file; the latest result wins
+            records[record["file"]] = record
+
+    if len(shard_counts) > 1:
+        raise ValueError(
+            f"Manifests from runs with different shard counts: {sorted(shard_counts)}"
+        )
+    shard_count = shard_counts.pop() if shard_counts else 0
+
+    merged_path = os.path.join(manifest_dir, MERGED_MANIFEST)
+    temp_path = merged_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for filename in sorted(records):
+            f.write(json.dumps(records[filename]) + "\n")
+    os.replace(temp_path, merged_path)
+
+    per_shard = {}
+    for record in records.values():
+        counts = per_shard.setdefault(record["shard"], {"files": 0, "renamed": 0})
+        counts["files"] += 1
+        counts["renamed"] += record["renamed"]
+
+    return {
+        "shard_count": shard_count,
+        "files": len(records),
+        "renamed": sum(record["renamed"] for record in records.values()),
+        "missing_shards": sorted(set(range(shard_count)) - seen_shards),
+        "per_shard": dict(sorted(per_shard.items())),
+        "manifest": merged_path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split snapshot conversion of an export across processes and hosts."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process one or more shards")
+    run_parser.add_argument("folder", help="Export folder (shared between hosts)")
+    run_parser.add_argument(
+        "--shards", type=int, required=True, help="Total shards across all hosts"
+    )
+    run_parser.add_argument(
+        "--shard",
+        type=int,
+        nargs="+",
+        help="Shards to run on this host (default: all of them)",
+    )
+    run_parser.add_argument(
+        "--processes", type=int, help="Shards to run at the same time on this host"
+    )
+    run_parser.add_argument("--manifest-dir", help="Default: <folder>/.shard_manifest")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge the shard manifests")
+    merge_parser.add_argument("manifest_dir")
+
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        summary = merge_manifests(args.manifest_dir)
+        print(json.dumps(summary, indent=2))
+        return
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"The folder '{args.folder}' does not exist.")
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    shards = args.shard if args.shard is not None else list(range(args.shards))
+    for shard in shards:
+        if not 0 <= shard < args.shards:
+            parser.error(f"Shard {shard} is out of range for {args.shards} shards")
+
+    manifest_dir = args.manifest_dir or os.path.join(args.folder, MANIFEST_DIRNAME)
+    results = run_shards(args.folder, shards, args.shards, manifest_dir, args.processes)
+    for shard, (processed, renamed) in sorted(results.items()):
+        print(f"Shard {shard}: processed {processed}, renamed {renamed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,51 @@
 import os
 import re
 import logging
-from psycopg2 import pool
-from weasyprint import HTML
 from datetime import datetime
 from tqdm import tqdm
-import signal
-from contextlib import contextmanager
 import gc
 import psutil
-
+import threading
+import time
+import shutil
+import tempfile
+from concurrent.futures import wait
+from metrics import REGISTRY, start_metrics_server
+from render_workers import (
+    RENDER_LIMIT_ERRORS,
+    RENDER_MEMORY_LIMIT_MB,
+    RENDER_RETRY_LIST,
+    RENDER_TIMEOUT,
+    list_for_retry,
+    render_isolated,
+    render_pool,
+    shutdown_shared_pool,
+    start_render_server,
+)
+from render_controller import (
+    RenderConcurrencyController,
+    RENDER_ORDER,
+    estimate_render_cost,
+    order_by_cost,
+)
+from learner_directory import (
+    DeferredFiles,
+    LearnerDirectoryUnavailable,
+    close_learner_directory,
+    get_learner_directory,
+    resolve_deferred,
+)
+from html_preprocessor import prepared_html
+from html_to_pdf import get_renderer
+from section_renderer import (
+    SPLIT_LARGE_HTML,
+    split_html_file,
+    render_section,
+    merge_pdfs,
+)
+from learner_bundle import BUNDLE_PDFS, plan_bundles, render_bundle
+from file_catalog import record_move, record_output, close_catalog
+from heap_profiler import track_file, stop_profiler
 
 # Configure logging
 logging.basicConfig(
@@ -17,14 +53,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database connection details
-DB_HOST = "127.0.0.1"
-DB_NAME = "datamigrationmakers"
-DB_USER = "mattdoyle"
-DB_PASS = ""
+# Where learner names come from; see learner_directory for the backends
+learner_directory = None
+
+# Set to a port number to serve live Prometheus metrics while a run is going
+METRICS_PORT = os.environ.get("METRICS_PORT")
+
+# Set FORCE_GC=0 to skip the explicit gc.collect() after each conversion and
+# batch; run with PROFILE_MEMORY=1 (see heap_profiler) to see what that changes
+FORCE_GC = os.environ.get("FORCE_GC", "1") == "1"
+
+# How much more time and memory each render gets on the retry pass
+RETRY_LIMIT_FACTOR = 4
+
+# Learner names already fetched this run, keyed by lower-case UUID
+learner_name_cache = {}
+
+# Files whose learner lookup hit an unavailable learner directory; retried at
+# the end of the run
+deferred_files = DeferredFiles()
+
+# Serialises picking a free filename and renaming onto it when files are
+# processed from several threads
+rename_lock = threading.Lock()
+
+files_processed = REGISTRY.counter(
+    "converter_files_total",
+    "Files handled by the converter, by pipeline stage and outcome.",
+    ["stage", "outcome"],
+)
+files_pending = REGISTRY.gauge(
+    "converter_files_pending", "Files found in the current run but not yet processed."
+)
+pdf_render_seconds = REGISTRY.summary(
+    "converter_pdf_render_seconds", "Time taken to render one HTML file to PDF."
+)
+learner_cache_lookups = REGISTRY.counter(
+    "converter_learner_cache_lookups_total",
+    "Learner name lookups, by whether the name was already cached.",
+    ["result"],
+)
+pdf_bytes = REGISTRY.counter(
+    "converter_pdf_bytes_total",
+    "Bytes of HTML converted and of PDF written from it.",
+    ["kind"],
+)
+pdf_render_concurrency = REGISTRY.gauge(
+    "converter_pdf_render_concurrency",
+    "PDF renders allowed and running at the same time.",
+    ["state"],
+)
+db_pool_connections = REGISTRY.gauge(
+    "converter_db_pool_connections",
+    "Database pool connections, by state.",
+    ["state"],
+)
+
+
+def _collect_pool_metrics():
+    # Only a Postgres directory has a pool, and only once it has connected
+    connection_pool = getattr(learner_directory, "pool", None)
+    if connection_pool:
+        db_pool_connections.set(len(connection_pool._used), state="in_use")
+        db_pool_connections.set(len(connection_pool._pool), state="idle")
+        db_pool_connections.set(connection_pool.maxconn, state="max")
 
-# Global connection pool
-connection_pool = None
+
+REGISTRY.add_collector(_collect_pool_metrics)
+
+# The concurrency controller for the PDF render phase that is running, if any
+render_controller = None
+
+
+def _collect_render_metrics():
+    if render_controller:
+        stats = render_controller.stats()
+        pdf_render_concurrency.set(stats["limit"], state="limit")
+        pdf_render_concurrency.set(stats["active"], state="active")
+
+
+REGISTRY.add_collector(_collect_render_metrics)
 
 
 def log_memory_usage():
@@ -34,96 +142,293 @@ def log_memory_usage():
 
 
 def init_connection_pool():
-    """Initialize the connection pool"""
-    global connection_pool
+    """Initialize the learner directory; a database backend connects on the first lookup"""
+    global learner_directory
     try:
-        connection_pool = pool.SimpleConnectionPool(
-            1,  # minimum connections
-            50,  # maximum connections
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-        )
-        logger.info("Database connection pool initialized")
+        learner_directory = get_learner_directory()
     except Exception as e:
-        logger.error(f"Failed to initialize connection pool: {str(e)}")
+        logger.error(f"Failed to initialize learner directory: {str(e)}")
         raise
 
 
-def get_db_connection():
-    """Get a connection from the pool"""
-    if connection_pool:
-        return connection_pool.getconn()
-    else:
-        raise Exception("Connection pool not initialized")
-
-
-def release_db_connection(conn):
-    """Return a connection to the pool"""
-    if connection_pool:
-        connection_pool.putconn(conn)
+def close_connection_pool():
+    """Close the learner directory and any connections it holds"""
+    global learner_directory
+    close_learner_directory()
+    learner_directory = None
 
 
 def get_learner_name(uuid):
-    """Fetches the learner's full name from the database based on UUID."""
-    conn = None
+    """Fetches the learner's full name from the learner directory based on UUID."""
+    if uuid.lower() in learner_name_cache:
+        learner_cache_lookups.inc(result="hit")
+        return learner_name_cache[uuid.lower()]
+    learner_cache_lookups.inc(result="miss")
+
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT learner_full_name FROM apprentice_info WHERE ApplicationId = %s",
-                (uuid.upper(),),
-            )
-            result = cursor.fetchone()
-            return result[0] if result else None
+        if learner_directory is None:
+            raise Exception("Learner directory not initialized")
+        learner_name = learner_directory.get_learner_name(uuid)
+        learner_name_cache[uuid.lower()] = learner_name
+        return learner_name
+    except LearnerDirectoryUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch learner name for UUID {uuid}: {str(e)}")
         return None
-    finally:
-        if conn:
-            release_db_connection(conn)
-
-
-@contextmanager
-def timeout(seconds):
-    """Context manager for timing out operations"""
-
-    def signal_handler(signum, frame):
-        raise TimeoutError("Operation timed out")
-
-    signal.signal(signal.SIGALRM, signal_handler)
-    signal.alarm(seconds)
-    try:
-        yield
-    finally:
-        signal.alarm(0)
 
 
 def convert_html_file_to_pdf(filename):
     """Convert an HTML file to PDF if applicable."""
     if filename.endswith(".html"):
         pdf_filename = filename.replace(".html", ".pdf")
+        start = time.monotonic()
         try:
-            # Create a new HTML object explicitly and clean it up
-            html = HTML(filename)
-            html.write_pdf(pdf_filename)
-
-            # Explicitly delete the HTML object
-            del html
-            gc.collect()
+            # The renderer keeps its fonts between files
+            with prepared_html(filename) as source:
+                get_renderer().render(
+                    source,
+                    pdf_filename,
+                    base_url=os.path.dirname(os.path.abspath(filename)),
+                )
 
+            pdf_render_seconds.observe(time.monotonic() - start)
             logger.info(f"Successfully converted {filename} to PDF.")
             return pdf_filename
+        except MemoryError:
+            # Let the render pool know this worker hit its memory limit
+            raise
         except Exception as e:
             logger.error(f"Failed to convert {filename} to PDF: {str(e)}")
             return None
         finally:
             # Force garbage collection
-            gc.collect()
+            if FORCE_GC:
+                gc.collect()
     return None
 
 
+def _render_in_worker(html_path):
+    """Runs in a render process: returns (pdf path or None, seconds, worker RSS)."""
+    start = time.monotonic()
+    with track_file(html_path):
+        pdf_file = convert_html_file_to_pdf(html_path)
+    rss = psutil.Process(os.getpid()).memory_info().rss
+    return pdf_file, time.monotonic() - start, rss
+
+
+def render_pdfs(
+    html_paths,
+    controller=None,
+    order=RENDER_ORDER,
+    split_large=SPLIT_LARGE_HTML,
+    bundle=BUNDLE_PDFS,
+    timeout=RENDER_TIMEOUT,
+    memory_limit_mb=RENDER_MEMORY_LIMIT_MB,
+    retry_list=RENDER_RETRY_LIST,
+):
+    """Renders HTML files to PDF on a process pool sized at runtime by the controller.
+
+    Files are started in order of estimated cost (see render_controller), so
+    one huge document is not left rendering on its own at the end. With
+    split_large, very large documents are rendered in sections on separate
+    workers and the section PDFs joined afterwards (see section_renderer).
+    With bundle, each learner's files become one PDF with a bookmark per
+    submission (see learner_bundle); files that were never renamed are still
+    rendered on their own.
+
+    Each render runs in a supervised worker that is killed if it goes over
+    timeout seconds or memory_limit_mb (see render_workers). Files stopped
+    that way are appended to retry_list for retry_over_limit_renders.
+    """
+    global render_controller
+    if not html_paths:
+        return 0
+
+    # bundle PDF path -> the HTML files that go into it
+    bundles = {}
+    if bundle:
+        bundles, html_paths = plan_bundles(html_paths)
+    total = len(html_paths) + sum(len(members) for members in bundles.values())
+    html_paths = order_by_cost(html_paths, order)
+
+    section_dir = tempfile.mkdtemp(prefix="pdf_sections_") if split_large else None
+    # html path -> its section PDFs, for documents rendered in sections
+    sectioned = {}
+    failed_sections = set()
+    # html or bundle paths whose render was stopped by a limit
+    over_limit = set()
+    # (html path or bundle PDF path, section html path or None)
+    jobs = [
+        (pdf_path, None)
+        for pdf_path in sorted(
+            bundles,
+            key=lambda pdf_path: sum(map(estimate_render_cost, bundles[pdf_path])),
+            reverse=order == "largest",
+        )
+    ]
+    for html_path in html_paths:
+        sections = split_html_file(html_path, section_dir) if split_large else []
+        if sections:
+            sectioned[html_path] = [
+                section[: -len(".html")] + ".pdf" for section in sections
+            ]
+            jobs.extend((html_path, section) for section in sections)
+        else:
+            jobs.append((html_path, None))
+
+    controller = controller or RenderConcurrencyController()
+    render_controller = controller
+    converted = 0
+    html_bytes = 0
+    output_bytes = 0
+    counter_lock = threading.Lock()
+
+    def record(html_path, pdf_file, seconds=None):
+        nonlocal converted, html_bytes, output_bytes
+        sources = bundles.get(html_path, [html_path])
+        status = "over_limit" if html_path in over_limit else "converted"
+        for source in sources:
+            record_output(
+                source,
+                pdf_file,
+                "pdf",
+                seconds,
+                status=status,
+                tool="snapshot_converter",
+            )
+        if pdf_file:
+            logger.info(f"Converted HTML to PDF: {pdf_file}")
+            files_processed.inc(len(sources), stage="pdf", outcome="converted")
+            try:
+                sizes = (
+                    sum(map(os.path.getsize, sources)),
+                    os.path.getsize(pdf_file),
+                )
+            except OSError:
+                sizes = 0, 0
+            pdf_bytes.inc(sizes[0], kind="html")
+            pdf_bytes.inc(sizes[1], kind="pdf")
+            with counter_lock:
+                converted += len(sources)
+                html_bytes += sizes[0]
+                output_bytes += sizes[1]
+        else:
+            logger.warning(f"Failed to convert HTML to PDF: {html_path}")
+            outcome = "over_limit" if html_path in over_limit else "failed"
+            files_processed.inc(len(sources), stage="pdf", outcome=outcome)
+
+    with tqdm(total=len(jobs), desc="Rendering PDFs") as pbar:
+
+        def finished(future, html_path, section):
+            controller.release()
+            try:
+                pdf_file, seconds, rss = future.result()
+            except RENDER_LIMIT_ERRORS as e:
+                logger.warning(
+                    f"PDF render stopped for {section or html_path}: {str(e)}"
+                )
+                over_limit.add(html_path)
+                pdf_file = None
+            except Exception as e:
+                logger.error(
+                    f"PDF conversion error for {section or html_path}: {str(e)}"
+                )
+                pdf_file = None
+            else:
+                controller.observe_render_rss(rss)
+                pdf_render_seconds.observe(seconds)
+
+            if section is None:
+                record(html_path, pdf_file, seconds if pdf_file else None)
+            elif not pdf_file:
+                failed_sections.add(html_path)
+            pbar.update(1)
+
+        with render_pool(
+            controller.max_workers, timeout=timeout, memory_limit_mb=memory_limit_mb
+        ) as executor:
+            futures = []
+            for html_path, section in jobs:
+                controller.acquire()
+                if html_path in bundles:
+                    future = executor.submit(
+                        render_bundle, bundles[html_path], html_path
+                    )
+                elif section is None:
+                    future = executor.submit(_render_in_worker, html_path)
+                else:
+                    future = executor.submit(
+                        render_section, section, os.path.dirname(html_path)
+                    )
+                future.add_done_callback(
+                    lambda future, html_path=html_path, section=section: finished(
+                        future, html_path, section
+                    )
+                )
+                futures.append(future)
+            wait(futures)
+
+    for html_path, section_pdfs in sectioned.items():
+        pdf_file = None
+        if html_path not in failed_sections:
+            try:
+                pdf_file = merge_pdfs(section_pdfs, html_path.replace(".html", ".pdf"))
+            except Exception as e:
+                logger.error(f"Failed to join the sections of {html_path}: {str(e)}")
+        record(html_path, pdf_file)
+
+    if section_dir:
+        shutil.rmtree(section_dir, ignore_errors=True)
+    render_controller = None
+    if over_limit and retry_list:
+        retry_paths = []
+        for path in over_limit:
+            retry_paths.extend(bundles.get(path, [path]))
+        list_for_retry(retry_paths, retry_list)
+        logger.warning(
+            f"{len(retry_paths)} HTML files went over the render limits; "
+            f"listed in {retry_list} for a retry pass"
+        )
+    logger.info(f"Converted {converted} out of {total} HTML files to PDF.")
+    if html_bytes:
+        logger.info(
+            f"HTML in: {html_bytes / 1024 / 1024:.1f} MB, "
+            f"PDF out: {output_bytes / 1024 / 1024:.1f} MB "
+            f"({output_bytes / html_bytes:.0%} of the input)"
+        )
+    return converted
+
+
+def retry_over_limit_renders(
+    retry_list=RENDER_RETRY_LIST, limit_factor=RETRY_LIMIT_FACTOR
+):
+    """Renders the files listed in retry_list again with more time and memory.
+
+    The list is emptied first; files that go over the raised limits as well
+    are listed again.
+    """
+    try:
+        with open(retry_list, encoding="utf-8") as f:
+            html_paths = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    except FileNotFoundError:
+        html_paths = []
+    html_paths = [path for path in html_paths if os.path.isfile(path)]
+    if not html_paths:
+        logger.info(f"No renders to retry in {retry_list}.")
+        return 0
+
+    os.remove(retry_list)
+    logger.info(f"Retrying {len(html_paths)} renders that went over the limits.")
+    start_render_server()
+    return render_pdfs(
+        html_paths,
+        timeout=RENDER_TIMEOUT * limit_factor,
+        memory_limit_mb=RENDER_MEMORY_LIMIT_MB * limit_factor,
+        retry_list=retry_list,
+    )
+
+
 def remove_unique_identifier(filename):
     """Removes unique identifiers (UUIDs, timestamps, etc.) from filenames and reformats."""
     logger.info(f"Processing filename: {filename}")
@@ -175,8 +480,33 @@ def increment_filename(directory, filename):
     return new_filename
 
 
-def rename_file(file_path):
-    """Renames a file and converts it to PDF if it's an HTML file."""
+def move_to_free_name(file_path, directory, filename):
+    """Moves a file onto the first free variant of filename and returns that name.
+
+    os.link fails if the target exists, so two processes (or hosts sharing the
+    folder) can never both claim the same name. Falls back to os.rename on
+    filesystems without hard links.
+    """
+    while True:
+        new_filename = increment_filename(directory, filename)
+        new_file_path = os.path.join(directory, new_filename)
+        try:
+            os.link(file_path, new_file_path)
+        except FileExistsError:
+            continue
+        except OSError:
+            os.rename(file_path, new_file_path)
+            return new_filename
+        os.unlink(file_path)
+        return new_filename
+
+
+def rename_file(file_path, render_queue=None):
+    """Renames a file and converts it to PDF if it's an HTML file.
+
+    If a render_queue list is given, renamed HTML files are appended to it
+    for render_pdfs instead of being converted straight away.
+    """
     try:
         directory = os.path.dirname(file_path)
         filename = os.path.basename(file_path)
@@ -184,18 +514,20 @@ def rename_file(file_path):
         # Check if the file is already a PDF and skip if so
         if filename.endswith(".pdf"):
             logger.info(f"Skipped: {filename} (already a PDF).")
+            files_processed.inc(stage="rename", outcome="skipped")
             return False
 
         new_filename, is_html = remove_unique_identifier(filename)
 
         # Only increment the filename if it's not already the same as the new filename
         if filename != new_filename:
-            new_filename = increment_filename(directory, new_filename)
-            new_file_path = os.path.join(directory, new_filename)
-
             try:
-                os.rename(file_path, new_file_path)
+                with rename_lock:
+                    new_filename = move_to_free_name(file_path, directory, new_filename)
+                new_file_path = os.path.join(directory, new_filename)
                 logger.info(f"Renamed: {filename} -> {new_filename}")
+                files_processed.inc(stage="rename", outcome="renamed")
+                record_move(file_path, new_file_path, tool="snapshot_converter")
 
                 if is_html:
                     # Check if PDF already exists
@@ -204,30 +536,71 @@ def rename_file(file_path):
                         logger.info(
                             f"PDF already exists: {pdf_filename}. Skipping conversion."
                         )
+                        files_processed.inc(stage="pdf", outcome="skipped")
                         return False  # No need to increment renamed count or process further
 
+                    if render_queue is not None:
+                        render_queue.append(new_file_path)
+                        return True
+
                     try:
-                        pdf_file = convert_html_file_to_pdf(new_file_path)
+                        # A supervised worker, so one file cannot hang or
+                        # exhaust the process that is renaming
+                        pdf_file, seconds, _ = render_isolated(
+                            _render_in_worker, new_file_path
+                        )
+                        record_output(
+                            new_file_path,
+                            pdf_file,
+                            "pdf",
+                            seconds if pdf_file else None,
+                            tool="snapshot_converter",
+                        )
                         if pdf_file:
                             logger.info(f"Converted HTML to PDF: {pdf_file}")
+                            files_processed.inc(stage="pdf", outcome="converted")
+                            pdf_render_seconds.observe(seconds)
                         else:
                             logger.warning(
                                 f"Failed to convert HTML to PDF: {new_file_path}"
                             )
+                            files_processed.inc(stage="pdf", outcome="failed")
+                    except RENDER_LIMIT_ERRORS as e:
+                        logger.warning(
+                            f"PDF render stopped for {new_file_path}: {str(e)}"
+                        )
+                        record_output(
+                            new_file_path,
+                            None,
+                            "pdf",
+                            status="over_limit",
+                            tool="snapshot_converter",
+                        )
+                        files_processed.inc(stage="pdf", outcome="over_limit")
+                        list_for_retry([new_file_path])
                     except Exception as e:
                         logger.error(
                             f"PDF conversion error for {new_file_path}: {str(e)}"
                         )
+                        files_processed.inc(stage="pdf", outcome="failed")
                         # Continue processing even if PDF conversion fails
                 return True
             except OSError as e:
                 logger.error(f"Error renaming {filename}: {e}")
+                files_processed.inc(stage="rename", outcome="error")
                 return False
         else:
             logger.info(f"Skipped: {filename} (no change needed)")
+            files_processed.inc(stage="rename", outcome="skipped")
             return False
+    except LearnerDirectoryUnavailable as e:
+        logger.warning(f"Deferred: {file_path} (learner directory unavailable: {e})")
+        files_processed.inc(stage="rename", outcome="deferred")
+        deferred_files.add(file_path)
+        return False
     except Exception as e:
         logger.error(f"Error processing {file_path}: {e}")
+        files_processed.inc(stage="rename", outcome="error")
         return False
 
 
@@ -239,22 +612,37 @@ def process_individual_file(file_path):
         logger.error(f"Error: The file '{file_path}' does not exist.")
 
 
+def rename_deferred(file_paths, render_queue):
+    """Renames files that were deferred earlier in the run; returns how many were renamed."""
+    return sum(1 for file_path in file_paths if rename_file(file_path, render_queue))
+
+
 def process_multiple_files(file_paths):
     """Process multiple files."""
     renamed_count = 0
+    render_queue = []
+    files_pending.set(len(file_paths))
+    start_render_server()
     for file_path in tqdm(file_paths, desc="Processing files"):
         if os.path.isfile(file_path):
-            if rename_file(file_path):
-                renamed_count += 1
+            with track_file(file_path):
+                if rename_file(file_path, render_queue):
+                    renamed_count += 1
         else:
             logger.warning(f"Skipped: '{file_path}' (file not found)")
+        files_pending.dec()
 
         # Periodic garbage collection
         if renamed_count % 100 == 0:
-            gc.collect()
+            if FORCE_GC:
+                gc.collect()
             log_memory_usage()
 
+    renamed_count += resolve_deferred(
+        deferred_files, lambda paths: rename_deferred(paths, render_queue)
+    )
     logger.info(f"Renamed {renamed_count} out of {len(file_paths)} files.")
+    render_pdfs(render_queue)
 
 
 def process_files_in_folder(folder_path):
@@ -265,10 +653,13 @@ def process_files_in_folder(folder_path):
 
     renamed_count = 0
     total_count = 0
+    render_queue = []
+    start_render_server()
 
     try:
         # Get total file count for progress bar
         total_files = sum(1 for entry in os.scandir(folder_path) if entry.is_file())
+        files_pending.set(total_files)
 
         # Process files with progress bar
         with tqdm(total=total_files, desc="Processing files") as pbar:
@@ -285,26 +676,39 @@ def process_files_in_folder(folder_path):
                     if len(files) >= batch_size:
                         for file_path in files:
                             try:
-                                if rename_file(file_path):
-                                    renamed_count += 1
+                                with track_file(file_path):
+                                    if rename_file(file_path, render_queue):
+                                        renamed_count += 1
                             except Exception as e:
                                 logger.error(f"Error processing {file_path}: {e}")
                             finally:
                                 pbar.update(1)
+                                files_pending.dec()
 
                         # Clear batch
                         files = []
-                        gc.collect()
+                        if FORCE_GC:
+                            gc.collect()
 
             # Process remaining files
             for file_path in files:
                 try:
-                    if rename_file(file_path):
-                        renamed_count += 1
+                    with track_file(file_path):
+                        if rename_file(file_path, render_queue):
+                            renamed_count += 1
                 except Exception as e:
                     logger.error(f"Error processing {file_path}: {e}")
                 finally:
                     pbar.update(1)
+                    files_pending.dec()
+
+        renamed_count += resolve_deferred(
+            deferred_files, lambda paths: rename_deferred(paths, render_queue)
+        )
+
+        # Render once every file has its final name, so renders can run in
+        # parallel without racing the renames
+        render_pdfs(render_queue)
 
     except Exception as e:
         logger.error(f"Error processing folder {folder_path}: {e}")
@@ -317,6 +721,8 @@ def process_files_in_folder(folder_path):
 def main():
     """Main function to handle user input and process files."""
     try:
+        if METRICS_PORT:
+            start_metrics_server(int(METRICS_PORT))
         init_connection_pool()
         log_memory_usage()
 
@@ -324,8 +730,9 @@ def main():
         print("1. Rename a single file")
         print("2. Rename multiple files")
         print("3. Rename all files in a folder")
+        print("4. Retry PDFs that went over the time or memory limit")
 
-        choice = input("Enter your choice (1/2/3): ").strip()
+        choice = input("Enter your choice (1/2/3/4): ").strip()
 
         try:
             if choice == "1":
@@ -345,9 +752,11 @@ def main():
             elif choice == "3":
                 folder_path = input("Enter the folder path: ").strip()
                 process_files_in_folder(folder_path)
+            elif choice == "4":
+                retry_over_limit_renders()
             else:
                 print(
-                    "Invalid choice. Please run the script again and choose 1, 2, or 3."
+                    "Invalid choice. Please run the script again and choose 1, 2, 3, or 4."
                 )
         except Exception as e:
             logger.error(f"Process error: {str(e)}")
@@ -355,8 +764,11 @@ def main():
     except Exception as e:
         logger.error(f"Critical error: {str(e)}")
     finally:
-        if connection_pool:
-            connection_pool.closeall()
+        close_connection_pool()
+        close_catalog()
+        # Workers save their heap profiles as they exit, before the merge
+        shutdown_shared_pool()
+        stop_profiler(merge_workers=True)
         log_memory_usage()
 
 
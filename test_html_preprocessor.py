@@ -0,0 +1,23 @@
+from html_preprocessor import preprocess_html_file
+
+MARKED_SECTIONS = """<!DOCTYPE html>
+<html><head><title>Evidence</title></head>
+<body>
+<!--[if IE]><p>Old browser</p><![endif]-->
+<svg xmlns="http://www.w3.org/2000/svg"><style><![CDATA[
+  rect { fill: #336699; }
+]]></style><rect width="10" height="10"/></svg>
+<math><annotation encoding="text/plain"><![CDATA[a < b && c > d]]></annotation></math>
+<![if !IE]><p>Modern browser</p><![endif]>
+</body></html>
+"""
+
+
+def test_marked_sections_round_trip(tmp_path):
+    html_path = tmp_path / "submission.html"
+    output_path = tmp_path / "prepared.html"
+    html_path.write_text(MARKED_SECTIONS, encoding="utf-8")
+
+    preprocess_html_file(str(html_path), str(output_path))
+
+    assert output_path.read_text(encoding="utf-8") == MARKED_SECTIONS
@@ -0,0 +1,207 @@
+import io
+import os
+import json
+import shutil
+import logging
+import zipfile
+from json_to_csv_converter import JSONtoCSVConverter
+from html_to_pdf import html_to_pdf
+from pattern_recognition import Pattern_Recog
+from learner_directory import LearnerDirectoryUnavailable
+from render_workers import RENDER_LIMIT_ERRORS, render_isolated
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Copy buffer used when streaming members from the source archive
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _unique_name(name, taken):
+    """Increments the name until it does not clash with one already written."""
+    base, ext = os.path.splitext(name)
+    new_name = name
+    counter = 1
+    while new_name in taken:
+        new_name = f"{base}({counter}){ext}"
+        counter += 1
+    taken.add(new_name)
+    return new_name
+
+
+class FolderOutput:
+    """Writes processed members into a destination folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.taken = set()
+        self.listed = set()
+
+    def _claim(self, name):
+        subfolder = os.path.dirname(name)
+        if subfolder not in self.listed:
+            folder_path = os.path.join(self.folder, subfolder)
+            os.makedirs(folder_path, exist_ok=True)
+            self.taken.update(
+                os.path.join(subfolder, existing)
+                for existing in os.listdir(folder_path)
+            )
+            self.listed.add(subfolder)
+        return _unique_name(name, self.taken)
+
+    def write_stream(self, name, source):
+        name = self._claim(name)
+        with open(os.path.join(self.folder, name), "wb") as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        return name
+
+    def write_bytes(self, name, data):
+        return self.write_stream(name, io.BytesIO(data))
+
+    def close(self):
+        pass
+
+
+class ZipOutput:
+    """Streams processed members into a new ZIP archive."""
+
+    def __init__(self, zip_path):
+        self.archive = zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.taken = set()
+
+    def write_stream(self, name, source):
+        name = _unique_name(name, self.taken)
+        with self.archive.open(name, "w", force_zip64=True) as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        return name
+
+    def write_bytes(self, name, data):
+        name = _unique_name(name, self.taken)
+        self.archive.writestr(name, data)
+        return name
+
+    def close(self):
+        self.archive.close()
+
+
+class zip_export_processor:
+    """Renames and converts the members of an export ZIP without extracting it."""
+
+    def __init__(self):
+        self.pattern_recog = Pattern_Recog()
+        self.json_converter = JSONtoCSVConverter()
+
+    @staticmethod
+    def _safe_member_name(name):
+        """Rejects absolute paths and '..' so members cannot escape the destination."""
+        name = os.path.normpath(name.replace("\\", "/"))
+        if os.path.isabs(name) or name.startswith(".."):
+            return None
+        return name
+
+    def plan_names(self, members):
+        """Works out the new name for each member, with one bulk learner lookup."""
+        parsed_members = {}
+        for member in members:
+            parsed = self.pattern_recog.parse_filename(
+                os.path.basename(member.filename)
+            )
+            if parsed is not None and self.pattern_recog.has_valid_uuid(parsed):
+                parsed_members[member.filename] = parsed
+
+        learner_names = self.pattern_recog.get_learner_names(
+            {parsed["uuid"] for parsed in parsed_members.values()}
+        )
+
+        new_names = {}
+        for member in members:
+            name = self._safe_member_name(member.filename)
+            if name is None:
+                continue
+            parsed = parsed_members.get(member.filename)
+            learner_name = learner_names.get(parsed["uuid"]) if parsed else None
+            if learner_name:
+                new_basename = self.pattern_recog.format_filename(parsed, learner_name)
+                name = os.path.join(os.path.dirname(name), new_basename)
+            new_names[member.filename] = name
+        return new_names
+
+    def _process_json(self, archive, member, name, output):
+        with archive.open(member) as source:
+            data = json.load(source)
+        data, csv_name = self.json_converter.prepare_data(data)
+        csv_name = self.json_converter.clean_csv_filename(csv_name)
+
+        csv_buffer = io.StringIO(newline="")
+        self.json_converter.write_csv(data, csv_buffer)
+        csv_name = output.write_bytes(
+            os.path.join(os.path.dirname(name), csv_name),
+            csv_buffer.getvalue().encode("utf-8"),
+        )
+        logger.info(f"Converted {member.filename} -> {csv_name}")
+
+        with archive.open(member) as source:
+            output.write_stream(name, source)
+
+    def _process_html(self, archive, member, name, output):
+        with archive.open(member) as source:
+            html_bytes = source.read()
+        html_name = output.write_bytes(name, html_bytes)
+
+        try:
+            pdf_bytes = render_isolated(
+                html_to_pdf.convert_html_string_to_pdf,
+                html_bytes.decode("utf-8", errors="replace"),
+                name=member.filename,
+            )
+        except RENDER_LIMIT_ERRORS as e:
+            logger.warning(f"PDF render stopped for {member.filename}: {str(e)}")
+            pdf_bytes = None
+        if pdf_bytes:
+            pdf_name = output.write_bytes(
+                os.path.splitext(html_name)[0] + ".pdf", pdf_bytes
+            )
+            logger.info(f"Converted HTML to PDF: {pdf_name}")
+        else:
+            logger.warning(f"Failed to convert HTML to PDF: {member.filename}")
+
+    def process_zip(self, zip_path, destination, to_zip=False):
+        """Processes every member of zip_path into a folder or, with to_zip, a new ZIP.
+
+        Returns the number of members written. Raises LearnerDirectoryUnavailable,
+        before anything is written, when the learner names cannot be looked up,
+        so the export can be run again once the directory is back instead of
+        coming out under UUID names.
+        """
+        processed = 0
+        with zipfile.ZipFile(zip_path) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir()]
+            new_names = self.plan_names(members)
+
+            output = ZipOutput(destination) if to_zip else FolderOutput(destination)
+            try:
+                for member in members:
+                    name = new_names.get(member.filename)
+                    if name is None:
+                        logger.warning(f"Skipped unsafe member name: {member.filename}")
+                        continue
+
+                    try:
+                        if member.filename.endswith(".json"):
+                            self._process_json(archive, member, name, output)
+                        elif member.filename.endswith(".html"):
+                            self._process_html(archive, member, name, output)
+                        else:
+                            with archive.open(member) as source:
+                                name = output.write_stream(name, source)
+                            if name != member.filename:
+                                logger.info(f"Renamed: {member.filename} -> {name}")
+                        processed += 1
+                    except Exception as e:
+                        logger.error(f"Error processing {member.filename}: {e}")
+            finally:
+                output.close()
+
+        logger.info(f"Processed {processed} out of {len(members)} archive members.")
+        return processed